@@ -0,0 +1,185 @@
+from bitShift import BitShift
+from eight_segment import Segment_Display
+from buzzer import Buzzer
+from button import Button
+from counter import Counter
+from switch import DISPLAY_REFRESH_HZ, SwitchConfig
+from concurrent.futures import Future
+import asyncio
+import itertools
+import queue
+import threading
+import time
+
+#how many characters per second the alarm text scrolls across the display
+ALARM_SCROLL_SPEED = 4
+
+class AsyncBoard:
+    """
+    Async adapter around an instantiated pymata4 board
+
+    Every call that writes to the serial link is run on a single worker thread. This keeps the event loop free while the link is
+    busy, and means writes from different tasks still reach the board one call at a time
+
+    Calls are queued by priority, so an urgent call (a buzzer edge) goes ahead of every normal call waiting for the link (display
+    scans) and only waits for the call already being sent. Calls of the same priority run in the order they were made
+    """
+    URGENT = 0
+    NORMAL = 1
+
+    def __init__(self, board) -> None:
+        self.board = board
+        #queue of (priority, order, future, function, args), order keeping calls of the same priority in order
+        self.calls = queue.PriorityQueue()
+        self.order = itertools.count()
+        self.worker = threading.Thread(target=self.worker_loop, name="serial", daemon=True)
+        self.worker.start()
+
+    def worker_loop(self):
+        """
+        Body of the serial thread, runs the queued calls one at a time, most urgent first
+        """
+        while True:
+            _, _, future, function, args = self.calls.get()
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(function(*args))
+            except BaseException as error:
+                future.set_exception(error)
+
+    async def run(self, function, *args, priority = NORMAL):
+        """
+        Runs function(*args) on the serial thread and waits for it to finish without blocking the event loop
+        """
+        future = Future()
+        self.calls.put((priority, next(self.order), future, function, args))
+        return await asyncio.wrap_future(future)
+
+async def refresh_display(serial, seg, refresh_hz = DISPLAY_REFRESH_HZ):
+    """
+    Task that scans the display framebuffer at a steady rate, scheduled against a monotonic deadline so the time taken by each scan
+    doesn't lower the refresh rate. If a scan overruns, the schedule restarts from now instead of trying to catch up
+
+    Every digit is scanned by a call of its own, so an urgent write only ever waits for one digit to be shifted out, not a whole scan
+    """
+    period = 1 / refresh_hz
+    deadline = time.monotonic()
+    while True:
+        #take the framebuffer once, so text changing part way through is still shown consistently
+        framebuffer = seg.framebuffer
+        for index in range(4):
+            if framebuffer[index] is not None:
+                await serial.run(seg.scan, tuple(glyph if digit == index else None for digit, glyph in enumerate(framebuffer)))
+        deadline += period
+        delay = deadline - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        else:
+            deadline = time.monotonic()
+
+async def countdown(seg, counter, reset_event, expired_event):
+    """
+    Task that shows the current count, updating it whenever it changes or the counter is reset, until the counter runs out
+    """
+    while not counter.expired():
+        seg.set_text(str(counter.count))
+        reset_event.clear()
+        #wake up when the count changes, or straight away if the button resets the counter
+        try:
+            await asyncio.wait_for(reset_event.wait(), counter.time_to_next_tick())
+        except asyncio.TimeoutError:
+            pass
+    seg.set_text("0")
+    expired_event.set()
+
+async def scroll_text(seg, text, speed = ALARM_SCROLL_SPEED):
+    """
+    Task that scrolls text across the display by updating the framebuffer, the refresh task keeps showing it. The step shown is
+    worked out from the clock, so a busy loop drops steps rather than slowing the text down
+    """
+    frames = seg.compile_sentence(text)
+    start = time.monotonic()
+    while True:
+        step = int((time.monotonic() - start) * speed)
+        if step >= len(frames):
+            break
+        seg.framebuffer = frames[step]
+        await asyncio.sleep(max(0, start + (step + 1) / speed - time.monotonic()))
+
+async def scroll_after(seg, expired_event):
+    """
+    Task that scrolls the alarm text once the counter has run out
+    """
+    await expired_event.wait()
+    await scroll_text(seg, "Alarm")
+    seg.set_text("0")
+
+async def sound_alarm(serial, buzzer, expired_event, bursts = 10):
+    """
+    Task that waits for the counter to run out and then sounds the alarm, one ramp up every second. The edges are urgent writes, so
+    they go ahead of the display scans waiting for the link and the steps keep their length
+    """
+    await expired_event.wait()
+    pattern = Buzzer.RAMP_UP_PATTERN + [(0, 1)]
+    deadline = time.monotonic()
+    for _ in range(bursts):
+        for level, duration in pattern:
+            await serial.run(buzzer.write_level, level, priority=AsyncBoard.URGENT)
+            deadline += duration
+            await asyncio.sleep(max(0, deadline - time.monotonic()))
+
+async def run(board, config = None):
+    """
+    Runs the dead mans switch on an event loop. The display refresh, the countdown and the alarm are separate tasks, and button
+    presses are handed from pymata4's reporter thread to the loop, so none of them hold the others up
+
+    INPUT:
+    - board representing an instantiated pymata4 board
+    - config representing a SwitchConfig describing the wiring, duration and refresh rate, the defaults used by main.py unless given
+    """
+    if config is None:
+        config = SwitchConfig()
+    loop = asyncio.get_running_loop()
+    serial = AsyncBoard(board)
+
+    bitshift = BitShift(board,config.latch_pin,config.data_pin,config.clock_pin,config.shift_register_count,
+                        board_shift=config.board_shift)
+    seg = Segment_Display(bitshift,config.digit_indexes,config.segment_indexes,common_anode=config.common_anode)
+    counter = Counter(config.duration)
+    buzzer = Buzzer(board,config.buzzer_pin)
+
+    reset_event = asyncio.Event()
+    expired_event = asyncio.Event()
+
+    def handle_press(on_press):
+        #runs on the event loop, the countdown task redraws as soon as the counter has been reset
+        on_press()
+        reset_event.set()
+
+    #nothing else needs the button, pymata4 keeps it alive through the callback it registers
+    Button(board,counter,config.button_pin,dispatch=lambda on_press: loop.call_soon_threadsafe(handle_press, on_press))
+
+    await serial.run(buzzer.ramp_up)
+
+    refresher = asyncio.create_task(refresh_display(serial, seg, config.refresh_hz))
+    try:
+        await asyncio.gather(
+            countdown(seg, counter, reset_event, expired_event),
+            sound_alarm(serial, buzzer, expired_event, config.alarm_bursts),
+            scroll_after(seg, expired_event),
+        )
+    finally:
+        refresher.cancel()
+        await serial.run(seg.reset_display)
+        #the reset only changes the register image, shift it out so the digit last scanned doesn't stay latched
+        await serial.run(bitshift.shift_out)
+
+if __name__ == "__main__":
+    from pymata4 import pymata4
+    #initialise the arduinoUno class
+    board = pymata4.Pymata4()
+    try:
+        asyncio.run(run(board))
+    finally:
+        board.shutdown()
@@ -0,0 +1,394 @@
+from simulated_board import SimulatedBoard
+from board_proxy import CoalescingBoard
+from bitShift import BitShift
+from eight_segment import Segment_Display, DisplayGroup
+from buzzer import Buzzer
+from counter import Counter
+from heartbeat import HeartbeatListener, generate_load
+from switch import ENABLE_OUTPUT, DATA_PIN, CLOCK_PIN, BUZZER, BUTTON, DIGIT_INDEXES, SEGMENT_INDEXES, DEADMANS_SWITCH_DURATION, \
+    DISPLAY_REFRESH_HZ, RESET_LATENCY_TARGET, DeadMansSwitch, SwitchConfig, show_count
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+#baud rate of the link being modelled
+BAUD_RATE = 57600
+
+#how much worse (as a fraction) a metric can get before compare() reports it as a regression
+TOLERANCE = 0.1
+
+def build_display(board, bulk = True, board_shift = False):
+    """
+    Wires a bitshift and segment display to board the same way main.py does
+    """
+    bitshift = BitShift(board,ENABLE_OUTPUT,DATA_PIN,CLOCK_PIN,2,bulk=bulk,board_shift=board_shift)
+    seg = Segment_Display(bitshift,DIGIT_INDEXES,SEGMENT_INDEXES,common_anode=True)
+    return bitshift, seg
+
+def build_display_bus(board, displays):
+    """
+    Chains two registers for every display, each display being wired to its own claimed range the same way main.py wires one
+    """
+    bitshift = BitShift(board,ENABLE_OUTPUT,DATA_PIN,CLOCK_PIN,2 * displays)
+    segs = [Segment_Display(bitshift.claim(16 * i, 16, f"display {i}"),DIGIT_INDEXES,SEGMENT_INDEXES,common_anode=True) for i in range(displays)]
+    for i, seg in enumerate(segs):
+        seg.set_text(str(1234 + i))
+    return bitshift, segs
+
+def measure(board, action, repeat = 1):
+    """
+    Runs action repeat times against a simulated board
+
+    OUTPUT:
+    - a dictionary with the messages, transfers, bytes and modelled link time per run, and the wall time per run
+    """
+    board.reset_counters()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        action()
+    wall = time.perf_counter() - start
+    return {
+        "messages": board.message_count() / repeat,
+        "transfers": board.transfers / repeat,
+        "bytes": board.bytesSent / repeat,
+        "link_seconds": board.linkBusyTime / repeat,
+        "wall_seconds": wall / repeat,
+    }
+
+def bench_shift_out(repeat):
+    results = {}
+    for name, bulk, board_shift in (("per_bit", False, False), ("bulk", True, False), ("board_shift", True, True)):
+        board = SimulatedBoard(BAUD_RATE)
+        bitshift, _ = build_display(board, bulk, board_shift)
+        def action():
+            #change the image every time, otherwise the unchanged frame would be skipped
+            bitshift.image ^= 0xFFFF
+            bitshift.shift_out()
+        results[name] = measure(board, action, repeat)
+    return results
+
+def bench_print_word(repeat):
+    results = {}
+    board = SimulatedBoard(BAUD_RATE)
+    _, seg = build_display(board)
+    results["bitshift"] = measure(board, lambda: seg.print_word("1234"), repeat)
+
+    board = SimulatedBoard(BAUD_RATE)
+    seg = Segment_Display(CoalescingBoard(board))
+    results["direct_pins"] = measure(board, lambda: seg.print_word("1234"), repeat)
+    return results
+
+def bench_rolling_sentence():
+    board = SimulatedBoard(BAUD_RATE)
+    _, seg = build_display(board)
+    return {"alarm": measure(board, lambda: seg.rolling_sentence("Alarm"))}
+
+def bench_display_group(repeat, displays = 2):
+    """
+    Scans several displays sharing one chain, once by scanning each display on its own and once as a group
+    """
+    results = {}
+    board = SimulatedBoard(BAUD_RATE)
+    _, segs = build_display_bus(board, displays)
+    def separately():
+        for seg in segs:
+            seg.scan()
+    results["separate_scans"] = measure(board, separately, repeat)
+
+    board = SimulatedBoard(BAUD_RATE)
+    _, segs = build_display_bus(board, displays)
+    results["group_scan"] = measure(board, DisplayGroup(segs).scan, repeat)
+    return results
+
+def bench_board_scan(refresh_hz = DISPLAY_REFRESH_HZ):
+    """
+    Measures one second of the countdown, once with the host scanning the display and once with the board scanning uploaded frames
+    """
+    results = {}
+    board = SimulatedBoard(BAUD_RATE)
+    _, seg = build_display(board)
+    seg.set_text("99")
+    #the count changes once a second, and the host scans refresh_hz times in that second
+    def host_second():
+        seg.set_text("98")
+        for _ in range(refresh_hz):
+            seg.scan()
+    results["host_scan"] = measure(board, host_second)
+
+    board = SimulatedBoard(BAUD_RATE)
+    _, seg = build_display(board)
+    seg.start_board_refresh(refresh_hz)
+    seg.set_text("99")
+    results["board_scan"] = measure(board, lambda: seg.set_text("98"))
+    return results
+
+def bench_buzzer():
+    results = {}
+    for name, board_timed in (("host_timed", False), ("board_timed", True)):
+        board = SimulatedBoard(BAUD_RATE, realtime=True)
+        buzzer = Buzzer(board, BUZZER, board_timed=board_timed)
+        results[name] = measure(board, buzzer.ramp_up)
+    return results
+
+def bench_refresh(seconds, refresh_hz = DISPLAY_REFRESH_HZ, board_shift = False):
+    """
+    Runs the display refresher on a realtime simulated link, and measures the scan rate it actually achieves and its jitter
+    """
+    board = SimulatedBoard(BAUD_RATE, realtime=True)
+    _, seg = build_display(board, board_shift=board_shift)
+    seg.set_text("1234")
+
+    times = []
+    scan = seg.scan
+    def timed_scan():
+        times.append(time.monotonic())
+        scan()
+    seg.scan = timed_scan
+
+    board.reset_counters()
+    seg.start_refresh(refresh_hz)
+    time.sleep(seconds)
+    seg.stop_refresh()
+
+    intervals = [b - a for a, b in zip(times, times[1:])]
+    return {
+        "target_hz": refresh_hz,
+        "achieved_hz": len(intervals) / (times[-1] - times[0]) if len(intervals) > 0 else 0.0,
+        "jitter_seconds": statistics.pstdev(intervals) if len(intervals) > 1 else 0.0,
+        "messages_per_second": board.message_count() / seconds,
+    }
+
+def bench_countdown(seconds):
+    """
+    Runs the main loop's countdown for seconds, with the display refreshing on a realtime simulated link, and measures how far the
+    time it took drifts from seconds
+    """
+    board = SimulatedBoard(BAUD_RATE, realtime=True)
+    _, seg = build_display(board)
+    seg.start_refresh(DISPLAY_REFRESH_HZ)
+    start = time.monotonic()
+    counter = Counter(seconds)
+    while counter.count != 0:
+        show_count(seg,counter)
+    elapsed = time.monotonic() - start
+    seg.stop_refresh()
+    return {"duration_seconds": seconds, "drift_seconds": elapsed - seconds}
+
+def bench_reset_latency(presses):
+    """
+    Runs a whole switch on a realtime simulated link and presses its button at random points of the refresh cycle, measuring the time
+    from each press being reported to the new count having been scanned onto the display
+    """
+    board = SimulatedBoard(BAUD_RATE, realtime=True)
+    switch = DeadMansSwitch(CoalescingBoard(board), SwitchConfig(duration=DEADMANS_SWITCH_DURATION))
+    #every press is accepted, they are far enough apart not to count as bounces
+    switch.button.lockout = 0
+    runner = threading.Thread(target=switch.run, daemon=True)
+    runner.start()
+    latencies = []
+    try:
+        deadline = time.monotonic() + 5
+        while switch.state != "counting" and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert switch.state == "counting", "the switch never started counting"
+
+        for _ in range(presses):
+            #let the countdown move on, so the press resets it to a different count
+            time.sleep(1 + random.random() / DISPLAY_REFRESH_HZ)
+            switch.lastResetLatency = None
+            board.press(BUTTON, hold=0.1)
+            deadline = time.monotonic() + RESET_LATENCY_TARGET * 4
+            while switch.lastResetLatency is None and time.monotonic() < deadline:
+                time.sleep(0.005)
+            if switch.lastResetLatency is not None:
+                latencies.append(switch.lastResetLatency)
+    finally:
+        switch.stop()
+        runner.join()
+
+    return {
+        "target_seconds": RESET_LATENCY_TARGET,
+        "missed": presses - len(latencies),
+        "mean_seconds": statistics.mean(latencies) if latencies else None,
+        "max_seconds": max(latencies) if latencies else None,
+    }
+
+def bench_heartbeat(rate = 5000, seconds = 3, sources = 50, interval = 1.0):
+    """
+    Floods a heartbeat listener on localhost with UDP heartbeats from many sources, counting how many of them were let through by the
+    rate limits and how many counter resets they turned into, which should be at most one per interval
+    """
+    counter = Counter(DEADMANS_SWITCH_DURATION)
+    listener = HeartbeatListener(counter.reset, port=0, interval=interval)
+    port = listener.start()
+    start = time.perf_counter()
+    sent = asyncio.run(generate_load(port, rate, seconds, sources))
+    wall = time.perf_counter() - start
+    #let the last coalesced reset land
+    time.sleep(interval)
+    listener.close()
+
+    received = listener.udpMetric.value
+    return {
+        "target_resets": seconds / interval + 1,
+        "sent": sent,
+        "received": received,
+        "limited": listener.limitedMetric.value,
+        "coalesced": listener.coalescedMetric.value,
+        "resets": listener.resetMetric.value,
+        "wall_seconds": wall,
+    }
+
+#run in a fresh interpreter by bench_startup, it builds a switch on a realtime simulated link the way main.py builds one on a real
+#board, and prints the wall clock time once the imports are done and once the first digit has been scanned onto the display
+STARTUP_PROBE = """
+import time
+from board_proxy import CoalescingBoard
+from simulated_board import SimulatedBoard
+from switch import DeadMansSwitch, SwitchConfig
+import os
+import threading
+imported = time.time()
+switch = DeadMansSwitch(CoalescingBoard(SimulatedBoard({baud_rate}, realtime=True)), SwitchConfig())
+threading.Thread(target=switch.run, daemon=True).start()
+while switch.state != "counting" or switch.seg.framebuffer == (None, None, None, None):
+    time.sleep(0.0005)
+switch.seg.wait_for_scan()
+print(imported, time.time(), flush=True)
+os._exit(0)
+"""
+
+def bench_startup(repeat = 3):
+    """
+    Measures the time from starting a new python process to the first digit of the countdown being on the display, and how much of it
+    is spent importing. The median of repeat runs is taken. pymata4 is no longer imported on this path, so the time it would add is
+    measured on its own, if it is installed
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    imports, totals = [], []
+    for _ in range(repeat):
+        start = time.time()
+        output = subprocess.run([sys.executable, "-c", STARTUP_PROBE.format(baud_rate=BAUD_RATE)], cwd=here, capture_output=True,
+                                text=True, check=True).stdout
+        imported, shown = map(float, output.split()[-2:])
+        imports.append(imported - start)
+        totals.append(shown - start)
+
+    start = time.time()
+    deferred = subprocess.run([sys.executable, "-c", "from pymata4 import pymata4"], capture_output=True)
+    return {
+        "import_seconds": statistics.median(imports),
+        "first_digit_seconds": statistics.median(totals),
+        "pymata4_import_seconds": time.time() - start if deferred.returncode == 0 else None,
+    }
+
+def check_targets(results):
+    """
+    OUTPUT:
+    - a list of (benchmark, case, metric, value, target) for every result that misses a fixed target, rather than one set by an earlier run
+    """
+    failures = []
+    reset = results.get("reset_latency", {}).get("button")
+    if reset is not None:
+        if reset["missed"]:
+            failures.append(("reset_latency", "button", "missed", reset["missed"], 0))
+        if reset["max_seconds"] is not None and reset["max_seconds"] > reset["target_seconds"]:
+            failures.append(("reset_latency", "button", "max_seconds", reset["max_seconds"], reset["target_seconds"]))
+    heartbeat = results.get("heartbeat", {}).get("udp_flood")
+    if heartbeat is not None and heartbeat["resets"] > heartbeat["target_resets"]:
+        failures.append(("heartbeat", "udp_flood", "resets", heartbeat["resets"], heartbeat["target_resets"]))
+    return failures
+
+def run(repeat = 20, refresh_seconds = 2, countdown_seconds = DEADMANS_SWITCH_DURATION, presses = 10):
+    """
+    Runs every benchmark
+
+    OUTPUT:
+    - a dictionary of results, keyed by benchmark and then by case, each case being a dictionary of metrics
+    """
+    return {
+        "shift_out": bench_shift_out(repeat),
+        "print_word": bench_print_word(repeat),
+        "rolling_sentence": bench_rolling_sentence(),
+        "display_group": bench_display_group(repeat),
+        "board_scan": bench_board_scan(),
+        "buzzer": bench_buzzer(),
+        "refresh": {"bitshift": bench_refresh(refresh_seconds), "board_shift": bench_refresh(refresh_seconds, board_shift=True)},
+        "countdown": {"main_loop": bench_countdown(countdown_seconds)},
+        "reset_latency": {"button": bench_reset_latency(presses)},
+        "startup": {"simulated": bench_startup()},
+        "heartbeat": {"udp_flood": bench_heartbeat()},
+    }
+
+def higher_is_better(metric):
+    return metric.endswith("_hz")
+
+def compare(previous, current, tolerance = TOLERANCE):
+    """
+    Compares two sets of results
+
+    OUTPUT:
+    - a list of (benchmark, case, metric, previous value, current value) for every metric that got worse by more than tolerance
+    - wall time is ignored, as it depends on the host more than on the code
+    """
+    regressions = []
+    for benchmark, cases in current.items():
+        for case, metrics in cases.items():
+            for metric, value in metrics.items():
+                old = previous.get(benchmark, {}).get(case, {}).get(metric)
+                if old is None or value is None or metric == "wall_seconds" or metric.startswith("target"):
+                    continue
+                if metric == "drift_seconds":
+                    value, old = abs(value), abs(old)
+                if higher_is_better(metric):
+                    worse = value < old * (1 - tolerance)
+                else:
+                    worse = value > old * (1 + tolerance) and value - old > 1e-9
+                if worse:
+                    regressions.append((benchmark, case, metric, old, value))
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="benchmarks the display, shift out and alarm paths against a simulated board")
+    parser.add_argument("--output", help="file the results are written to as JSON")
+    parser.add_argument("--compare", help="JSON results of an earlier run, regressions against it make the exit status non zero")
+    parser.add_argument("--repeat", type=int, default=20, help="how many times the short benchmarks are repeated")
+    parser.add_argument("--refresh-seconds", type=float, default=2, help="how long the refresh rate is measured for")
+    parser.add_argument("--countdown-seconds", type=int, default=DEADMANS_SWITCH_DURATION, help="length of the countdown drift benchmark")
+    parser.add_argument("--presses", type=int, default=10, help="how many button presses the reset latency is measured over")
+    args = parser.parse_args()
+
+    report = {
+        "time": time.time(),
+        "python": platform.python_version(),
+        "baud_rate": BAUD_RATE,
+        "results": run(args.repeat, args.refresh_seconds, args.countdown_seconds, args.presses),
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(text)
+    else:
+        print(text)
+
+    #fixed targets are always checked, an earlier run is only needed for regressions
+    failures = check_targets(report["results"])
+    for benchmark, case, metric, value, target in failures:
+        print(f"TARGET MISSED {benchmark}/{case}/{metric}: {value:.6g} (target {target:.6g})", file=sys.stderr)
+
+    regressions = []
+    if args.compare:
+        with open(args.compare) as file:
+            previous = json.load(file)["results"]
+        regressions = compare(previous, report["results"])
+        for benchmark, case, metric, old, value in regressions:
+            print(f"REGRESSION {benchmark}/{case}/{metric}: {old:.6g} -> {value:.6g}", file=sys.stderr)
+    sys.exit(1 if regressions or failures else 0)
@@ -1,5 +1,7 @@
-from pymata4 import pymata4
-from eight_segment import Segment_Display
+from firmata_commands import DISPLAY_FRAME, SHIFT_OUT, encode_display_frame, encode_shift_out, send_pin_writes, setup_output_pins
+from tracing import traced
+import metrics
+import threading
 import time
 
 class BitShift:
@@ -14,17 +16,32 @@ class BitShift:
     component objects, the board variable should be assigned with a BitShift object instead of an ArduinoUno object.
 
     This means that methods inside this class have the same name as that of the pymata4 class such that the implementation is easier.
+
+    The register image is stored as one packed integer, where bit i of the integer is output i of the chain. When bulk is enabled, the
+    whole frame (every data write and clock pulse) is encoded and handed to the board in a single serial transfer instead of one
+    pymata4 call per edge. By default bulk is used whenever the board supports raw commands. Bulk only saves calls, the same pin writes
+    still go over the link, so on a slow link a shift still takes around 100 bytes.
+
+    With the SHIFT_OUT firmware extension, board_shift has the board shift the image out itself from one sysex message of about 10
+    bytes, which is what makes a steady refresh possible at 57600 baud. Bulk (or per bit) writes are kept for stock firmware.
+
+    The last latched image is remembered, so shifting out an image identical to what the registers are already outputting is skipped.
+    framesShifted and framesSkipped count how often each happened, and how long every shift takes is recorded in the metrics registry.
+
+    A long chain can be shared as a register bus: claim() hands out a RegisterView over a range of its outputs, which has the same
+    interface as the bitshift but with its own indexes starting at 0. Several displays (or other outputs) can each be given a view,
+    their writes are all merged into the one image, and a single shift_out() sends every one of them.
+
+    With the DISPLAY_FRAME firmware extension, upload_frame() hands the board a list of images to cycle through by itself, so the host
+    only sends anything when the images change.
     """
-    def __init__(self, board, latchPin, dataPin, clockPin, shiftRegisterCount = 1) -> None:
+    def __init__(self, board, latchPin, dataPin, clockPin, shiftRegisterCount = 1, bulk = None, board_shift = False) -> None:
         #the board that the bitshift is connected to
         self.board = board
 
         #the latch pin to output the registers
         self.latchPin = latchPin
 
-        #a boolean representing if the registers are currently being outputted
-        self.latched = True
-
         #data pin representing individual bits being stored in the register
         self.dataPin = dataPin
 
@@ -34,8 +51,37 @@ class BitShift:
         #represents how many shift registers are being used
         self.shiftRegisterCount = shiftRegisterCount
 
-        #8 bits of data to be written and outputted parallel
-        self.data = [0 for _ in range(8 * shiftRegisterCount)]
+        #8 bits of data per register to be written and outputted parallel, packed into a single integer
+        self.image = 0
+
+        #whether the whole frame is sent to the board in a single transfer
+        if bulk is None:
+            bulk = hasattr(board, "_send_command")
+        self.bulk = bulk
+
+        #whether every shift is a single SHIFT_OUT message, which needs the firmware extension in firmware/
+        self.board_shift = board_shift
+
+        #the image currently being outputted by the registers, None until the first shift
+        self.lastLatched = None
+
+        #counters for how many frames were actually sent, and how many were skipped because nothing changed
+        self.framesShifted = 0
+        self.framesSkipped = 0
+
+        #metrics shared by every bitshift, see metrics.py
+        self.shiftTime = metrics.histogram("bitshift_shift_out_seconds")
+        self.shiftedMetric = metrics.counter("bitshift_frames_shifted")
+        self.skippedMetric = metrics.counter("bitshift_frames_skipped")
+
+        #how many display frames were uploaded for the board to scan
+        self.framesUploaded = 0
+
+        #the ranges of outputs handed out by claim(), as (start, width, name)
+        self.claims = []
+
+        #lock held while the image is changed or shifted out, so views used from different threads don't lose each other's writes
+        self.lock = threading.RLock()
 
         #initialise all pins
         self.initialise_pins()
@@ -53,16 +99,91 @@ class BitShift:
         - if the index is within the range of the bit shift register, the bit is stored in the appropriate index
         """
         #the index being written to must be within range
-        assert 0 <= index < 8 * self.shiftRegisterCount - 1, "index being written to must be valid on bitshift"
+        assert 0 <= index < 8 * self.shiftRegisterCount, "index being written to must be valid on bitshift"
 
-        #data should only be written to bitShift if it is not currently being outputted, therefore if the latch pin is not active, latch it
-        if not self.latched:
-            self.latched = True
-            self.board.digital_pin_write(self.latchPin,0)
+        #write data to index of the register image, the latch pin is tied low by shift_out itself, so it doesn't need a write of its own
+        with self.lock:
+            if int(bit):
+                self.image |= 1 << index
+            else:
+                self.image &= ~(1 << index)
+
+    def write_mask(self, mask, bits):
+        """
+        Writes several indexes of the bitshift array at once
+
+        INPUT:
+        - self representing an instance of the class
+        - mask representing which indexes are being written, bit i representing index i
+        - bits representing the value for each of those indexes, bits outside of mask are ignored
+
+        OUTPUT:
+        - every index in mask is set to the matching bit of bits, all other indexes are left unchanged
+        """
+        with self.lock:
+            self.image = (self.image & ~mask) | (bits & mask)
+
+    def image_with(self, mask, bits):
+        """
+        OUTPUT:
+        - the register image as it would be after write_mask(mask, bits), without changing it
+        """
+        return (self.image & ~mask) | (bits & mask)
+
+    def upload_frame(self, images, period):
+        """
+        Hands the board a list of images to shift out one after another by itself, until the next upload
+
+        INPUT:
+        - self representing an instance of the class
+        - images representing the images of the whole chain, bit i being output i. A single image is shifted out once and held
+        - period representing how many milliseconds each image is held for
+
+        OUTPUT:
+        - one DISPLAY_FRAME sysex message is sent. The board now drives the registers, so the next shift_out() is always sent
+        """
+        with self.lock:
+            data = encode_display_frame(self.latchPin, self.dataPin, self.clockPin, self.shiftRegisterCount, images, period)
+            self.board._send_sysex(DISPLAY_FRAME, data)
+            self.lastLatched = None
+            self.framesUploaded += 1
+
+    def claim(self, start, width, name = None):
+        """
+        Claims a range of outputs of the chain for one component
+
+        INPUT:
+        - self representing an instance of the class
+        - start representing the first output of the range
+        - width representing how many outputs are in the range
+        - name representing an optional name for the range, only used in error messages
+
+        OUTPUT:
+        - a RegisterView over outputs start to start + width - 1, the range must fit in the chain and can't overlap any other claim
+        """
+        assert width > 0 and 0 <= start and start + width <= 8 * self.shiftRegisterCount, "claimed range must be within the bitshift"
+        for otherStart, otherWidth, otherName in self.claims:
+            assert start + width <= otherStart or otherStart + otherWidth <= start, \
+                f"outputs {start}-{start + width - 1} overlap the range claimed by {otherName or otherStart}"
+        self.claims.append((start, width, name))
+        return RegisterView(self, start, width)
+
+    @property
+    def data(self):
+        """
+        List view of the register image, index i representing output i of the chain. Assigning a list packs it back into the image
+        """
+        return [(self.image >> index) & 1 for index in range(8 * self.shiftRegisterCount)]
+
+    @data.setter
+    def data(self, bits):
+        assert len(bits) == 8 * self.shiftRegisterCount, "data must contain one bit for every output of the bitshift"
+        image = 0
+        for index, bit in enumerate(bits):
+            if int(bit):
+                image |= 1 << index
+        self.image = image
 
-        #write data to index of list
-        self.data[index] = int(bit)
-        
     def initialise_pins(self):
         """
         Set the latch, data and clock pins as digital outputs and tie them to ground to begin
@@ -73,17 +194,38 @@ class BitShift:
         OUTPUT:
         - all of the specified pins are set as digital outputs and tied to ground
         """
-        #set all pins to digital outputs
-        self.board.set_pin_mode_digital_output(self.latchPin)
-        self.board.set_pin_mode_digital_output(self.dataPin)
-        self.board.set_pin_mode_digital_output(self.clockPin)
+        #set all pins to digital outputs and tie them to ground, batched into as few transfers as the board allows
+        setup_output_pins(self.board, (self.latchPin, self.dataPin, self.clockPin), 0)
+
+        #the contents of the registers are unknown until the first shift
+        self.lastLatched = None
+
+    def frame_writes(self):
+        """
+        Builds the ordered list of pin writes needed to shift the current register image out and latch it
+
+        INPUT:
+        - self representing an instance of the class
 
-        #tie to ground
-        self.board.digital_pin_write(self.latchPin,0)
-        self.board.digital_pin_write(self.dataPin,0)
-        self.board.digital_pin_write(self.clockPin,0)
+        OUTPUT:
+        - a list of (pin, value) pairs, the latch is tied low, every bit is written to the data pin (most significant first) followed by
+          a clock pulse, and then the latch is tied high. The data pin is only rewritten when the bit differs from the previous one
+        """
+        image = self.image
+        writes = [(self.latchPin, 0)]
+        dataLevel = None
+        for digit in range(8 * self.shiftRegisterCount - 1, -1, -1):
+            bit = (image >> digit) & 1
+            if bit != dataLevel:
+                writes.append((self.dataPin, bit))
+                dataLevel = bit
+            writes.append((self.clockPin, 1))
+            writes.append((self.clockPin, 0))
+        writes.append((self.latchPin, 1))
+        return writes
 
-    def shift_out(self):
+    @traced
+    def shift_out(self, force = False):
         """
         For every bit in the bitshift array, shift it into the bitshift register and then set the latch pin to high to output it to the pins
 
@@ -92,28 +234,119 @@ class BitShift:
 
         This is repeated for every single bit of data, when that is done, the latchpin is set to high which outputs all the bits to the pins
 
+        In bulk mode the same sequence of writes is sent to the board as one serial transfer, and with board_shift only the image is sent
+        and the board does the writes
+
         INPUT:
         - self representing an instance of the class
+        - force representing whether the image should be shifted even if it matches the image that is already latched
         
         OUTPUT:
         - all of the appropriate data is outputted via the bit shift register output pins
+        - if the image has not changed since the last shift, nothing is sent and framesSkipped is incremented
+        """
+        with self.lock:
+            #the registers already hold this image, so there is nothing to send
+            if not force and self.image == self.lastLatched:
+                self.framesSkipped += 1
+                self.skippedMetric.inc()
+                return
+
+            start = time.perf_counter()
+            image = self.image
+            if self.board_shift:
+                self.board._send_sysex(SHIFT_OUT, encode_shift_out(self.latchPin, self.dataPin, self.clockPin, self.shiftRegisterCount,
+                                                                   image))
+                #the board moved the pins of the chain itself, so a proxy's copy of their levels is out of date
+                if hasattr(self.board, "invalidate"):
+                    for pin in (self.latchPin, self.dataPin, self.clockPin):
+                        self.board.invalidate(pin)
+            elif self.bulk:
+                #hand the whole frame to the board at once
+                send_pin_writes(self.board, self.frame_writes())
+            else:
+                #otherwise write every edge individually
+                for pin, value in self.frame_writes():
+                    self.board.digital_pin_write(pin, value)
+            self.lastLatched = image
+            self.framesShifted += 1
+            self.shiftedMetric.inc()
+            self.shiftTime.observe(time.perf_counter() - start)
+
+class RegisterView:
+    """
+    This is a class for a range of outputs of a BitShift, as returned by BitShift.claim()
+
+    It has the same interface as the BitShift, so it can be given to any component in place of the board, but index 0 of the view is
+    output start of the chain. Writes only change the shared image, and shift_out() shifts out the whole chain, including whatever the
+    other views have written since the last shift.
+    """
+    def __init__(self, bus, start, width) -> None:
+        #the bitshift the range belongs to
+        self.bus = bus
+
+        #the first output of the range, and how many outputs it has
+        self.start = start
+        self.width = width
+
+        #bits of the view, before being moved to the start of the range
+        self.mask = (1 << width) - 1
+
+    def digital_pin_write(self, index, bit):
+        """
+        INPUT:
+        - self representing an instance of the class
+        - index representing the position within the range that we are writing to
+        - bit representing the data being stored
+
+        OUTPUT:
+        - the bit is stored at output start + index of the bus image
+        """
+        assert 0 <= index < self.width, "index being written to must be within the claimed range"
+        self.bus.digital_pin_write(self.start + index, bit)
+
+    def write_mask(self, mask, bits):
+        """
+        INPUT:
+        - self representing an instance of the class
+        - mask representing which indexes of the range are being written, bit i representing index i
+        - bits representing the value for each of those indexes
+
+        OUTPUT:
+        - the indexes are written in the bus image, in a single update
+        """
+        assert mask & ~self.mask == 0, "mask must be within the claimed range"
+        self.bus.write_mask(mask << self.start, bits << self.start)
+
+    @property
+    def image(self):
+        """
+        The bits of the bus image that belong to this range, bit i representing index i
+        """
+        return (self.bus.image >> self.start) & self.mask
+
+    def image_with(self, mask, bits):
+        """
+        OUTPUT:
+        - the image of the whole bus as it would be after write_mask(mask, bits), without changing it
+        """
+        assert mask & ~self.mask == 0, "mask must be within the claimed range"
+        return self.bus.image_with(mask << self.start, bits << self.start)
+
+    def upload_frame(self, images, period):
+        """
+        Uploads images of the whole bus for the board to scan, see BitShift.upload_frame()
+        """
+        self.bus.upload_frame(images, period)
+
+    def shift_out(self, force = False):
+        """
+        Shifts out the whole bus, see BitShift.shift_out()
         """
-        #tie the latchpin to ground so it doesn't output
-        self.board.digital_pin_write(self.latchPin,0)
-
-        #for every bit in the shift register array, in reverse order
-        for digit in range(8 * self.shiftRegisterCount - 1,-1,-1):
-            #write bit to data pin
-            self.board.digital_pin_write(self.dataPin,int(self.data[digit]))
-            #pulse clock high then low to signify next bit is going to be sent
-            self.board.digital_pin_write(self.clockPin,1)
-            self.board.digital_pin_write(self.clockPin,0)
-        #set latch boolean to false to signify that bitshift is outputting
-        self.latched = False
-        #tie latch pin to high to output all data in bitshift register
-        self.board.digital_pin_write(self.latchPin,1)
+        self.bus.shift_out(force)
 
 if __name__ == "__main__":
+    from pymata4 import pymata4
     board = pymata4.Pymata4()
     bitshift = BitShift(board,4,7,8,2)
     bitshift.data = [1,1,1,1,1,1,1,1,1,1,1,1,1,1,1,1]
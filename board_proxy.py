@@ -0,0 +1,172 @@
+from contextlib import contextmanager
+from firmata_commands import DIGITAL_MESSAGE, encode_pin_writes
+import threading
+
+class CoalescingBoard:
+    """
+    This class wraps an instantiated pymata4 board and has the same interface, so it can be given to any component in place of the board
+
+    Writes made inside a frame() are not sent straight away. Only the final level of every pin is kept, and when the outermost frame
+    ends the changes are sent in as few messages as possible: a single pin change in a port is sent as a SET_DIGITAL_PIN_VALUE, and
+    several changes in the same port are sent as one whole-port DIGITAL_MESSAGE. Everything is handed to the board in one transfer
+
+    A port message sets every output pin of that port, so all digital writes to the board must go through this object for its copy
+    of the port levels to be correct. Outside of a frame, writes are passed straight through
+
+    The same copy of the pin levels is used as a cache: when cache is True, any write (direct, coalesced, or part of an ordered
+    sequence from a bitshift) that would leave a pin at the level it is already at is dropped. cacheHits counts the dropped writes and
+    cacheMisses the ones that were sent. If something else changes the pins behind this object's back, call invalidate()
+    """
+    def __init__(self, board, cache = True) -> None:
+        #the board being wrapped
+        self.board = board
+
+        #the level every pin was last sent at, and the writes waiting for the current frame to end
+        self.levels = {}
+        self.pending = {}
+
+        #how many frames are currently open, frames can be nested
+        self.depth = 0
+        self.lock = threading.RLock()
+
+        #whether writes that don't change a pin's level are dropped
+        self.cache = cache
+
+        #counters for how many writes were asked for, and how many messages actually went to the board
+        self.writesRequested = 0
+        self.messagesSent = 0
+
+        #counters for how many writes were dropped by the cache, and how many had to be sent
+        self.cacheHits = 0
+        self.cacheMisses = 0
+
+    def __getattr__(self, name):
+        #everything that isn't a digital write (pin modes, callbacks, shutdown...) goes straight to the board
+        return getattr(self.board, name)
+
+    @contextmanager
+    def frame(self):
+        """
+        Context manager that holds back digital writes until it exits, frames can be nested and are only sent when the outermost one ends
+        """
+        with self.lock:
+            self.depth += 1
+            try:
+                yield self
+            finally:
+                self.depth -= 1
+                if self.depth == 0:
+                    self.flush()
+
+    def digital_pin_write(self, pin, value):
+        """
+        Writes value to pin, or holds it back until the end of the frame if one is open
+        """
+        with self.lock:
+            self.writesRequested += 1
+            if self.depth:
+                self.pending[pin] = value
+                return
+            if not self.changes(pin, value):
+                return
+            self.levels[pin] = value
+            self.messagesSent += 1
+            self.board.digital_pin_write(pin, value)
+
+    def digital_pin_write_many(self, writes):
+        """
+        Sends an ordered sequence of (pin, value) writes in one transfer. Nothing is coalesced, so this is used when the order of the
+        writes matters, like the clock pulses of a bitshift
+        """
+        with self.lock:
+            self.flush()
+            sent = []
+            for pin, value in writes:
+                self.writesRequested += 1
+                #a write is only dropped if the pin is already at that level at this point of the sequence
+                if self.changes(pin, value):
+                    self.levels[pin] = value
+                    sent.append((pin, value))
+            if not sent:
+                return
+            self.messagesSent += len(sent)
+            self.board._send_command(encode_pin_writes(sent))
+
+    def changes(self, pin, value):
+        """
+        Checks the cache for a write, counting it as a hit or a miss
+
+        OUTPUT:
+        - False if the cache is enabled and the pin is already known to be at value, so the write can be dropped, True otherwise
+        """
+        if self.cache and self.levels.get(pin) == value:
+            self.cacheHits += 1
+            return False
+        self.cacheMisses += 1
+        return True
+
+    def invalidate(self, pin = None):
+        """
+        Forgets the level of pin (or of every pin if pin is None), so the next write to it is always sent
+        """
+        with self.lock:
+            if pin is None:
+                self.levels = {}
+            else:
+                self.levels.pop(pin, None)
+
+    def cache_stats(self):
+        """
+        OUTPUT:
+        - a dictionary with the number of cache hits and misses, and the fraction of writes that were dropped
+        """
+        total = self.cacheHits + self.cacheMisses
+        return {
+            "hits": self.cacheHits,
+            "misses": self.cacheMisses,
+            "hit_rate": self.cacheHits / total if total else 0.0,
+        }
+
+    def flush(self):
+        """
+        Sends every write held back by the frame, in as few messages as possible
+        """
+        with self.lock:
+            if not self.pending:
+                return
+            #group the pins that actually change by port
+            ports = {}
+            for pin, value in self.pending.items():
+                if self.changes(pin, value):
+                    ports.setdefault(pin // 8, []).append((pin, value))
+            self.pending = {}
+
+            message = bytearray()
+            for port, changes in ports.items():
+                for pin, value in changes:
+                    self.levels[pin] = value
+                if len(changes) == 1:
+                    message += encode_pin_writes(changes)
+                else:
+                    #the whole port is written, using the last level sent for every other pin in it
+                    bits = 0
+                    for pin in range(port * 8, port * 8 + 8):
+                        if self.levels.get(pin):
+                            bits |= 1 << (pin - port * 8)
+                    message += bytes((DIGITAL_MESSAGE | port, bits & 0x7F, (bits >> 7) & 0x7F))
+                self.messagesSent += 1
+            if message:
+                self.board._send_command(bytes(message))
+
+    def _send_command(self, command):
+        #anything held back is sent first, so the board sees the commands in the order they were made
+        with self.lock:
+            self.flush()
+            self.messagesSent += 1
+            return self.board._send_command(command)
+
+    def _send_sysex(self, sysex_command, sysex_data = None):
+        with self.lock:
+            self.flush()
+            self.messagesSent += 1
+            return self.board._send_sysex(sysex_command, sysex_data)
@@ -1,34 +1,128 @@
-from pymata4 import pymata4
 from counter import Counter
+from concurrent.futures import ThreadPoolExecutor
+from tracing import traced
+from typing import TYPE_CHECKING
+import metrics
 import time
+import traceback
+
+#pymata4 is only needed for the annotation, and is imported lazily everywhere else so importing a component doesn't pay for it
+if TYPE_CHECKING:
+    from pymata4 import pymata4
 class Button:
+    """
+    This class is used to reset a counter when a push button connected to a digital input is pressed
+
+    The callback is called from pymata4's reporter thread, so it never sleeps or does any real work. It only debounces the pin with a
+    small state machine and hands accepted presses to dispatch (by default a single worker thread), which runs on_press()
+
+    - debounce represents how long (in seconds) the pin must have been stable before a rising edge counts as a press
+    - lockout represents the minimum number of seconds between two accepted presses
+    - dispatch represents a callable that is given on_press to run later, e.g. an executor's submit
+    - on_reset represents a callable run by on_press once the counter has been reset, given the monotonic time the press was accepted
 
-    def __init__(self,board: pymata4.Pymata4,counter: Counter, pin = 0):
+    The metrics registry records how long the reporter took to call the callback after the board's report arrived, how long an accepted
+    press waited to be dispatched, and how many edges were accepted, ignored as bounces or ignored by the lockout
+    """
+    def __init__(self,board: "pymata4.Pymata4",counter: Counter, pin = 0, debounce = 0.05, lockout = 5, dispatch = None, on_reset = None):
         self.board = board
 
         self.counter = counter
 
         self.pin = pin
 
+        self.debounce = debounce
+
+        self.lockout = lockout
+
+        #last level reported for the pin, and when it last changed, on the monotonic clock
+        self.level = 0
+        self.lastChange = time.monotonic()
+
+        #presses are handed off so the reporter thread returns straight away
+        self.executor = None
+        if dispatch is None:
+            self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="button")
+            dispatch = self.executor.submit
+        self.dispatch = dispatch
+        self.on_reset = on_reset
+        #set by close(), presses are ignored from then on
+        self.closed = False
+
+        #presses within lockout seconds of starting up are ignored as well
+        self.lastTimePressed = time.monotonic()
+
+        #button metrics, see metrics.py
+        #how long the reporter thread spends in button_callback, the wait for on_press to start is dispatchLatency
+        self.callbackTime = metrics.histogram("button_callback_seconds")
+        self.dispatchLatency = metrics.histogram("button_dispatch_latency_seconds")
+        self.pressMetric = metrics.counter("button_presses")
+        self.bounceMetric = metrics.counter("button_bounces")
+        self.lockoutMetric = metrics.counter("button_lockouts")
+        self.errorMetric = metrics.counter("button_errors")
+
         self.initialise_pin()
-        
-        self.lastTimePressed = time.time()
 
     def button_callback(self,data):
-        time.sleep(0.1)
-        if data[2] == 1 and abs(time.time() - self.lastTimePressed) > 5:
-            self.lastTimePressed = time.time()
-            print("resetting")
+        """
+        pymata4 callback, data being [pin_type, pin_number, pin_value, raw_time_stamp]
+
+        A rising edge counts as a press if the pin had been low for at least debounce seconds (so bounces are ignored), and the
+        last press was at least lockout seconds ago
+        """
+        now = time.monotonic()
+        try:
+            level = data[2]
+            if level == self.level:
+                return
+            stable = now - self.lastChange >= self.debounce
+            self.level = level
+            self.lastChange = now
+
+            if level != 1:
+                return
+            if not stable:
+                self.bounceMetric.inc()
+            elif now - self.lastTimePressed < self.lockout:
+                self.lockoutMetric.inc()
+            elif not self.closed:
+                self.lastTimePressed = now
+                self.pressMetric.inc()
+                self.dispatch(self.on_press)
+        finally:
+            self.callbackTime.observe(time.monotonic() - now)
+
+    def close(self):
+        """
+        Stops accepting presses and shuts down the worker thread made when no dispatch was given, a press already being handled is
+        left to finish
+        """
+        self.closed = True
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+
+    def on_press(self):
+        """
+        Runs for every accepted press, outside of pymata4's reporter thread
+
+        An error is printed and counted here rather than raised, as the default dispatch keeps it in a future nothing reads
+        """
+        self.dispatchLatency.observe(time.monotonic() - self.lastTimePressed)
+        print("resetting")
+        try:
             self.counter.reset()
-            
+            if self.on_reset is not None:
+                self.on_reset(self.lastTimePressed)
+        except Exception:
+            self.errorMetric.inc()
+            traceback.print_exc()
 
+    @traced
     def initialise_pin(self):
         """
-        Set power pin to digital output, which allows it to be toggled to play a sound
+        Set pin to digital input, with button_callback being called whenever its value changes
         """
-        #set pin to digital output and tie to ground so it begins not playing nothing
         # self.board.set_pin_mode_analog_input(self.analogIn,self.button_callback)
         self.board.set_pin_mode_digital_input(self.pin,self.button_callback)
         print(f"Initialized pin {self.pin} as digital input with callback")
-    
 
@@ -1,117 +1,285 @@
-from pymata4 import pymata4
+from firmata_commands import BUZZER_SEQUENCE, encode_buzzer_sequence, setup_output_pins
+from tracing import traced
+import metrics
+import threading
 import time
+import traceback
 
 class Buzzer:
     """
     this class is meant to allow the control of an active buzzer. the current parameters are required
     - board representing an arduino the buzzer is connected to
     - power pin representing the pin it draws power from
+
+    Sounds are declared as patterns, lists of (level, duration) steps. A pattern is played by a background thread, so play() returns
+    straight away and the caller (and the display refresher) can keep running while the buzzer sounds. Playing a new pattern replaces
+    the one currently playing, and cancel() stops it and turns the buzzer off
+
+    If board_timed is True, every pattern is handed to the board as a single BUZZER_SEQUENCE message and the board times the steps
+    itself, so the host sends one message per pattern rather than one per edge. This needs the firmware extension in firmware/
     """
-    def __init__(self, board, powerPin = 2) -> None:
+    #unique reset sound that is played when the 555 timer reset signal is sent and the arduino is about to reset
+    RESET_PATTERN = [(1, 0.5), (0, 0.5), (1, 0.5), (0, 0)]
+    #unique sound for ramping up of fans
+    RAMP_UP_PATTERN = [(1, 0.05), (0, 0.05), (1, 0.05), (0, 0)]
+    #unique sound for ramping down of fans
+    RAMP_DOWN_PATTERN = [(1, 0.04), (0, 0.04), (1, 0.04), (0, 0.04), (1, 0.04), (0, 0)]
+    #short chirp confirming the counter has been reset
+    CHIRP_PATTERN = [(1, 0.03), (0, 0)]
+
+    def __init__(self, board, powerPin = 2, board_timed = False) -> None:
         #the board that the buzzer is connected to
         self.board = board
         #the power pin that is set to high when the buzzer is being used
         self.powerPin = powerPin
+        #whether patterns are timed by the board rather than by the host
+        self.board_timed = board_timed
+
+        #the pattern waiting to be played or currently playing, and how many times it is repeated (0 repeats until cancelled)
+        self.pattern = None
+        self.repeat = 1
+        #incremented every time the pattern is replaced or cancelled, so the player knows to stop the old one
+        self.generation = 0
+        #whether a pattern is currently playing
+        self.playing = False
+        #the level last written to the power pin
+        self.level = 0
+
+        #metrics of how many patterns were played or cancelled, and how many times the power pin was written
+        self.patternMetric = metrics.counter("buzzer_patterns")
+        self.cancelMetric = metrics.counter("buzzer_cancels")
+        self.edgeMetric = metrics.counter("buzzer_edges")
+
+        #condition used to hand patterns to the player thread, the thread is only started when the first pattern is played
+        self.condition = threading.Condition()
+        self.player = None
+        #set by close(), the player thread exits once it sees it
+        self.closed = False
+
+        #last error raised while writing a pattern to the board, and the callable it is given to on the player thread, if it is None
+        #the error is only printed. The pattern is dropped either way and the player waits for the next one
+        self.error = None
+        self.on_error = None
 
         #initialise pins
         self.initialise_pin()
 
+    @traced
     def initialise_pin(self):
         """
         Set power pin to digital output, which allows it to be toggled to play a sound
         """
         #set pin to digital output and tie to ground so it begins not playing nothing
-        self.board.set_pin_mode_digital_output(self.powerPin)
-        self.board.digital_pin_write(self.powerPin,0)
-        
-    def reset(self):
+        setup_output_pins(self.board, (self.powerPin,), 0)
+        self.level = 0
+
+    def play(self, pattern, repeat = 1):
+        """
+        Plays a pattern in the background, replacing any pattern that is currently playing
+
+        INPUT:
+        - self representing an instance of the class
+        - pattern representing a list of (level, duration) steps, level being the value written to the power pin and duration the
+          number of seconds it is held for
+        - repeat representing how many times the pattern is played, 0 meaning it repeats until cancel() is called
+
+        OUTPUT:
+        - the pattern starts playing straight away, this method does not wait for it to finish
+        """
+        self.patternMetric.inc()
+        with self.condition:
+            assert not self.closed, "the buzzer is closed"
+            self.pattern = tuple(pattern)
+            self.repeat = repeat
+            self.generation += 1
+            self.playing = True
+            #start the player the first time anything is played
+            if self.player is None:
+                self.player = threading.Thread(target=self.player_loop, daemon=True)
+                self.player.start()
+            self.condition.notify_all()
+
+    def cancel(self):
+        """
+        Stops the pattern that is currently playing (if any) and turns the buzzer off
+        """
+        self.cancelMetric.inc()
+        with self.condition:
+            self.pattern = None
+            self.generation += 1
+            self.condition.notify_all()
+
+    def close(self):
+        """
+        Stops the pattern that is currently playing (if any) and the player thread, waiting for it to exit. The buzzer can't be
+        played once it is closed
+        """
+        with self.condition:
+            self.closed = True
+            self.pattern = None
+            self.generation += 1
+            self.condition.notify_all()
+            player = self.player
+        if player is not None and player is not threading.current_thread():
+            player.join()
+
+    def wait(self, timeout = None):
+        """
+        Blocks until the buzzer has finished playing
+
+        INPUT:
+        - self representing an instance of the class
+        - timeout representing the maximum number of seconds to wait, None meaning no limit
+
+        OUTPUT:
+        - True if the buzzer is no longer playing, False if the timeout ran out first
+        """
+        with self.condition:
+            return self.condition.wait_for(lambda: not self.playing, timeout)
+
+    def write_level(self, level):
+        """
+        Writes level to the power pin, unless the pin is already at that level
+        """
+        if level != self.level:
+            self.board.digital_pin_write(self.powerPin, level)
+            self.level = level
+            self.edgeMetric.inc()
+
+    def player_loop(self):
+        """
+        Body of the player thread. Waits for a pattern, plays it, and then marks the buzzer as no longer playing, unless the pattern
+        was replaced in the meantime
+        """
+        while True:
+            with self.condition:
+                while self.pattern is None and not self.closed:
+                    self.playing = False
+                    self.condition.notify_all()
+                    self.condition.wait()
+                if self.closed:
+                    self.playing = False
+                    self.condition.notify_all()
+                    break
+                pattern, repeat, generation = self.pattern, self.repeat, self.generation
+
+            try:
+                finished = self.play_steps(pattern, repeat, generation)
+                #whether the pattern finished or was interrupted, the buzzer is left off
+                self.write_level(0)
+            except Exception as error:
+                self.error = error
+                finished = True
+                if self.on_error is None:
+                    traceback.print_exc()
+                else:
+                    self.on_error(error)
+
+            with self.condition:
+                if finished and self.generation == generation:
+                    self.pattern = None
+
+    @traced
+    def play_steps(self, pattern, repeat, generation):
+        """
+        Plays the steps of a pattern. Every step is timed against a monotonic deadline, so the time spent writing to the board doesn't
+        stretch the pattern
+
+        OUTPUT:
+        - True if every step was played, False if the pattern was replaced or cancelled part way through
+        """
+        if self.board_timed:
+            return self.play_on_board(pattern, repeat, generation)
+
+        deadline = time.monotonic()
+        count = 0
+        while repeat == 0 or count < repeat:
+            for level, duration in pattern:
+                self.write_level(level)
+                deadline += duration
+                with self.condition:
+                    #wake up early if the pattern is replaced or cancelled
+                    if self.condition.wait_for(lambda: self.generation != generation, deadline - time.monotonic()):
+                        return False
+            count += 1
+        return True
+
+    @traced
+    def play_on_board(self, pattern, repeat, generation):
+        """
+        Sends the whole pattern to the board in one message, and then waits for as long as the board takes to play it, so that
+        wait() and replacing patterns behave the same as when the host times the steps
+
+        OUTPUT:
+        - True if the board finished the pattern, False if it was replaced or cancelled part way through
+        """
+        self.board._send_sysex(BUZZER_SEQUENCE, encode_buzzer_sequence(self.powerPin, pattern, repeat))
+        #the board ends every pattern with the buzzer off
+        self.level = 0
+
+        if repeat == 0:
+            deadline = None
+        else:
+            deadline = time.monotonic() + sum(duration for _, duration in pattern) * repeat
+
+        with self.condition:
+            timeout = None if deadline is None else deadline - time.monotonic()
+            if not self.condition.wait_for(lambda: self.generation != generation, timeout):
+                return True
+            #the pattern was replaced or cancelled, tell the board to stop playing it
+            if self.pattern is None:
+                self.board._send_sysex(BUZZER_SEQUENCE, encode_buzzer_sequence(self.powerPin, [], 1))
+            return False
+
+    def reset(self, block = True):
         """
         Unique reset sound that is played when the 555 timer reset signal is sent and the arduino is about to reset
 
         INPUT:
         - self representing an instance of the class
+        - block representing whether to wait for the sound to finish before returning
 
         OUTPUT:
         - a unique reset sound
         """
-        #Tone and Time are constants that are representing the time between beeps
-        #Tone is only used for a pwm signal, otherwise it is set to 1 to represent a HIGH digital output
-        TONE = 1
-        TIME = 0.5
-        #turn buzzer on
-        self.board.digital_pin_write(self.powerPin,TONE)
-        #wait for a certain amount of time
-        time.sleep(TIME)
-        #turn buzzer off
-        self.board.digital_pin_write(self.powerPin,0)
-        #wait for a certain amount of time
-        time.sleep(TIME)
-        #turn buzzer on
-        self.board.digital_pin_write(self.powerPin,TONE)
-        #wait for a certain amount of time
-        time.sleep(TIME)
-        #turn buzzer off
-        self.board.digital_pin_write(self.powerPin,0)
-    def ramp_up(self):
+        self.play(self.RESET_PATTERN)
+        if block:
+            self.wait()
+
+    def ramp_up(self, block = True):
         """
         unique sound for ramping up of fans
-        - tone represents the PWM write to the power pin, if a digital output pin is used set to 1
-        - time represents the interval between each tone
-        """
-        TONE = 1
-        TIME = 0.05
-        #turn buzzer on
-        self.board.digital_pin_write(self.powerPin,TONE)
-        #wait for a certain amount of time
-        time.sleep(TIME)
-        #turn buzzer off
-        self.board.digital_pin_write(self.powerPin,0)
-        #wait for a certain amount of time
-        time.sleep(TIME)
-        #turn buzzer on
-        self.board.digital_pin_write(self.powerPin,TONE)
-        #wait for a certain amount of time
-        time.sleep(TIME)
-        #turn buzzer off
-        self.board.digital_pin_write(self.powerPin,0)
-
-    def ramp_down(self):
+        - block represents whether to wait for the sound to finish before returning
+        """
+        self.play(self.RAMP_UP_PATTERN)
+        if block:
+            self.wait()
+
+    def ramp_down(self, block = True):
         """
         unique sound for ramping down of fans
-        - tone represents the PWM write to the power pin, if a digital output pin is used set to 1
-        - time represents the interval between each tone
-        """
-        TONE = 1
-        TIME = 0.04
-        #turn buzzer on
-        self.board.digital_pin_write(self.powerPin,TONE)
-        #wait for a certain amount of time
-        time.sleep(TIME)
-        #turn buzzer off
-        self.board.digital_pin_write(self.powerPin,0)
-        #wait for a certain amount of time
-        time.sleep(TIME)
-        #turn buzzer on
-        self.board.digital_pin_write(self.powerPin,TONE)
-        #wait for a certain amount of time
-        time.sleep(TIME)
-        #turn buzzer off
-        self.board.digital_pin_write(self.powerPin,0)
-        #wait for a certain amount of time
-        time.sleep(TIME)
-        #turn buzzer on
-        self.board.digital_pin_write(self.powerPin,TONE)
-        #wait for a certain amount of time
-        time.sleep(TIME)
-        #turn buzzer off
-        self.board.digital_pin_write(self.powerPin,0)
+        - block represents whether to wait for the sound to finish before returning
+        """
+        self.play(self.RAMP_DOWN_PATTERN)
+        if block:
+            self.wait()
+
+    def chirp(self, block = False):
+        """
+        short chirp confirming the counter has been reset
+        - block represents whether to wait for the chirp to finish before returning
+        """
+        self.play(self.CHIRP_PATTERN)
+        if block:
+            self.wait()
 
 if __name__ == "__main__":
     """
     Tester code just to tune ramp up and ramp down
     """
+    from pymata4 import pymata4
     board = pymata4.Pymata4()
     buzzer = Buzzer(board, 3)
     buzzer.ramp_up()
     time.sleep(1)
-    buzzer.ramp_down()
\ No newline at end of file
+    buzzer.ramp_down()
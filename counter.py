@@ -1,12 +1,60 @@
-
+import math
+import threading
+import time
 
 class Counter:
-    def __init__(self,initial) -> None:
+    """
+    This class counts down from initial seconds. Rather than being decremented by a loop, it stores an absolute deadline on the
+    monotonic clock, and the count is worked out from it whenever it is read, so time spent elsewhere never makes it drift
+
+    - initial represents the number of seconds counted down from
+    - clock represents the function used to read the time, time.monotonic unless given
+    """
+    def __init__(self,initial, clock = time.monotonic) -> None:
         self.initial = initial
-        self.count = initial
-    
+        self.clock = clock
+        #the deadline is moved by the button thread, and read by the main loop
+        self.lock = threading.Lock()
+        self.deadline = clock() + initial
+
+    def remaining(self):
+        """
+        OUTPUT:
+        - the number of seconds until the deadline, 0 once it has passed
+        """
+        return max(0.0, self.deadline - self.clock())
+
+    @property
+    def count(self):
+        """
+        The number of whole seconds left, rounded up, so it reads initial straight after a reset and only reaches 0 at the deadline
+        """
+        return math.ceil(self.remaining())
+
+    def expired(self):
+        return self.remaining() == 0
+
+    def time_to_next_tick(self):
+        """
+        OUTPUT:
+        - the number of seconds until count next changes, 0 if the deadline has already passed
+        """
+        remaining = self.remaining()
+        if remaining == 0:
+            return 0.0
+        return remaining - (math.ceil(remaining) - 1)
+
     def decrement(self):
-        self.count -= 1
-    
+        #bring the deadline one second closer
+        with self.lock:
+            self.deadline -= 1
+
+    def resume(self, remaining):
+        #move the deadline so that remaining seconds are left, used to carry on from a saved deadline
+        with self.lock:
+            self.deadline = self.clock() + remaining
+
     def reset(self):
-        self.count = self.initial
\ No newline at end of file
+        #move the deadline so that initial seconds are left again
+        with self.lock:
+            self.deadline = self.clock() + self.initial
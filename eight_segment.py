@@ -1,5 +1,128 @@
 import time
-from pymata4 import pymata4
+from contextlib import nullcontext
+from firmata_commands import setup_output_pins
+from tracing import traced
+import metrics
+import threading
+
+class Refresher():
+    """
+    This class runs the refresher thread of a display, calling scan at a steady rate until it is stopped. Segment_Display and
+    DisplayGroup each give it their own scan
+
+    Scans are scheduled against a monotonic deadline, so the time spent writing to the board does not slow the refresh rate down. If a
+    scan overruns its slot, the schedule is restarted from now rather than trying to catch up. request() wakes the thread early for an
+    extra scan
+
+    If writing to the board fails the thread stops, keeping the error in error and handing it to on_error on the refresher thread, if
+    on_error is None the error is raised there instead and only printed
+    """
+    def __init__(self, scan) -> None:
+        self.scan = scan
+
+        #background thread, the event used to stop it, and the event used to wake it for an immediate scan
+        self.thread = None
+        self.stop_event = threading.Event()
+        self.wake_event = threading.Event()
+
+        #how many scans the thread has started and finished, and the condition notified whenever one finishes
+        self.scansStarted = 0
+        self.scansFinished = 0
+        self.scanned = threading.Condition()
+
+        self.error = None
+        self.on_error = None
+
+        #refresh metrics, see metrics.py
+        self.intervalMetric = metrics.histogram("display_refresh_interval_seconds")
+        self.scanMetric = metrics.histogram("display_scan_seconds")
+        self.overrunMetric = metrics.counter("display_refresh_overruns")
+
+    @property
+    def running(self):
+        return self.thread is not None
+
+    def start(self, refresh_hz):
+        """
+        Starts the thread scanning refresh_hz times per second, unless it is already running
+        """
+        if self.thread is not None:
+            return
+        self.stop_event.clear()
+        self.error = None
+        self.thread = threading.Thread(target=self.loop, args=(refresh_hz,), daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """
+        OUTPUT:
+        - the thread is stopped and waited for, True if it was running
+        """
+        if self.thread is None:
+            return False
+        self.stop_event.set()
+        self.wake_event.set()
+        self.thread.join()
+        self.thread = None
+        return True
+
+    def request(self):
+        """
+        Wakes the thread to scan straight away instead of waiting for its next slot
+        """
+        self.wake_event.set()
+
+    def wait_for_scan(self, timeout = None):
+        """
+        OUTPUT:
+        - blocks until the thread has finished a scan that started after this was called. True if it did, False if the timeout ran out
+          first, the thread isn't running or it stopped on an error
+        """
+        if self.thread is None:
+            return False
+        with self.scanned:
+            target = self.scansStarted + 1
+            return self.scanned.wait_for(lambda: self.scansFinished >= target or self.error is not None, timeout) and self.error is None
+
+    def loop(self, refresh_hz):
+        """
+        Body of the refresher thread
+        """
+        try:
+            period = 1 / refresh_hz
+            deadline = time.monotonic()
+            last = None
+            while not self.stop_event.is_set():
+                start = time.monotonic()
+                #the interval between scans, its standard deviation is the refresh jitter
+                if last is not None:
+                    self.intervalMetric.observe(start - last)
+                last = start
+                #a refresh requested from here on needs another scan
+                self.wake_event.clear()
+                with self.scanned:
+                    self.scansStarted += 1
+                self.scan()
+                with self.scanned:
+                    self.scansFinished += 1
+                    self.scanned.notify_all()
+                self.scanMetric.observe(time.monotonic() - start)
+                deadline += period
+                delay = deadline - time.monotonic()
+                if delay > 0:
+                    self.wake_event.wait(delay)
+                else:
+                    self.overrunMetric.inc()
+                    deadline = time.monotonic()
+        except Exception as error:
+            #the link to the board failed, hand the error to whoever owns the display rather than dying quietly
+            self.error = error
+            #anything waiting for a scan is woken, the scan it waits for will never come
+            with self.scanned:
+                self.scanned.notify_all()
+            if self.on_error is None:
+                raise
+            self.on_error(error)
 
 ######################################################################
 # 12 PIN 8 SEGMENT DISPLAY
@@ -8,8 +131,27 @@ class Segment_Display():
     """
     This class is used to instantiate a Segment_Display Object
     This object initialises the given pins, resets the display, and then allows you to write characters, words and sentences to any position on the display
+
+    Both common cathode and common anode displays are supported through common_anode. The polarity is applied once, when the glyphs are
+    compiled, so nothing has to be inverted while writing
+
+    The display also holds a 4 digit framebuffer. Once start_refresh() has been called, a background thread multiplexes the framebuffer
+    onto the display at a steady rate, so callers only need to call set_text() and the display stays lit regardless of what else is running
+
+    Text is compiled into glyphs before it reaches the framebuffer, and sentences are compiled once into a tuple of framebuffers (one for
+    every scroll step) which is cached by text, so scrolling the same sentence again costs nothing but the writes
+
+    Scrolling and showing text for a while are timed by the monotonic clock, at an explicit number of characters per second and refresh
+    rate. When the link can't keep up, frames are dropped instead of the text slowing down
+
+    If the display is on a bitshift and the board has the DISPLAY_FRAME firmware extension, start_board_refresh() has the board scan
+    the framebuffer by itself instead. The image of every lit digit is uploaded in one message whenever the framebuffer changes, and
+    nothing at all is sent while it stays the same
+
+    The refresher records the interval between scans (its rate and jitter), how long each scan takes and how often it overruns its
+    slot in the metrics registry
     """
-    def __init__(self, board, digit_pins: list = [2,3,4,5], segment_pins: list = [6,7,8,9,10,11,12,13]) -> None:
+    def __init__(self, board, digit_pins: list = [2,3,4,5], segment_pins: list = [6,7,8,9,10,11,12,13], common_anode: bool = False) -> None:
         
         #assertions to ensure correct parameters are entered
 
@@ -20,6 +162,9 @@ class Segment_Display():
 
         #board represents an Instantiated ArduinoUno Board, or a Bitshift register
         self.board = board
+
+        #a common anode display enables a digit by tying it high and lights a segment by tying it low, a common cathode display is the opposite
+        self.common_anode = common_anode
         
         #declare digit and segment pins for Segment_Display, if no parameter is given it is automatically assigned 2,3,4,5 for digit_pins and 6,7,8,9,10,11,12,13 for segment_pins
         self.digit_pins = {
@@ -39,12 +184,36 @@ class Segment_Display():
         "dec": segment_pins[7]
         }
 
+        #whether the board scans the framebuffer by itself, the rate it does so at, and the framebuffer it was last given
+        self.board_scanning = False
+        self.board_refresh_hz = self.REFRESH_HZ
+        self.uploaded = None
+
+        #framebuffer holding the compiled glyph shown on each digit (None for a blank digit), index 0 being the rightmost digit
+        self.framebuffer = (None, None, None, None)
+
+        #compiled scroll steps of recently rolled sentences, keyed by sentence
+        self.sentence_cache = {}
+
+        #lock held while the board is being written to, so the refresher and the caller don't interleave writes
+        self.lock = threading.RLock()
+
+        #background refresher thread scanning the framebuffer, its on_error is given the error if writing to the board fails
+        self.refresher = Refresher(self.scan)
+
+        #if the board keeps a register image (a BitShift), a whole digit can be written as one masked update of that image
+        self.bitshift = hasattr(board, "write_mask")
+
+        #compile charLookup into bit masks for these pins, so writing a character doesn't have to parse the lookup strings
+        self.compile_glyphs()
+
         #Initialise all required pins to digital outputs
         self.initialise_pins()
         #reset all values of the display to 0 so nothing is showing
         self.reset_display()
 
     #charLookup is a dictionary that contains the appropriate data that should be given to the segment pins for each character
+    #a 1 represents a lit segment, for a common anode display every bit is inverted when the glyphs are compiled
     charLookup = {
     " ": "00000000",
     "0": "11111100",
@@ -65,8 +234,8 @@ class Segment_Display():
     "f":"10001110",
     "g":"10111100",
     "h":"01101110",
-    "i":"000011000",
-    "j":"011110000",
+    "i":"00001100",
+    "j":"01111000",
     "k":"00001110",
     "l":"00011100",
     "m":"11000100",
@@ -85,6 +254,67 @@ class Segment_Display():
     "z":"01001010",
     }
 
+    def compile_glyphs(self):
+        """
+        Compiles charLookup into bit masks for the pins of this display. Bit n of every mask represents pin n (or index n of a bitshift)
+
+        INPUT
+        - self representing an instance of the class
+
+        OUTPUT
+        - self.glyphs, mapping every character (and every character followed by a ".") to the levels of all 8 segment pins
+        - self.segment_mask and self.digit_masks, the bits that belong to the segment pins and to each digit pin
+        - self.digit_on, self.digit_off and self.segment_off, the levels needed to enable or disable digits and to blank every segment
+        """
+        segment_pins = list(self.segment_pins.values())
+
+        self.segment_mask = 0
+        for pin in segment_pins:
+            self.segment_mask |= 1 << pin
+
+        self.digit_masks = [1 << self.digit_pins[str(index)] for index in range(4)]
+        digit_mask = sum(self.digit_masks)
+
+        #levels of every digit bit when the digits are enabled or disabled, and of every segment bit when the segments are blank
+        self.digit_on = digit_mask if self.common_anode else 0
+        self.digit_off = 0 if self.common_anode else digit_mask
+        self.segment_off = self.segment_mask if self.common_anode else 0
+
+        decimal_bit = 1 << self.segment_pins["dec"]
+        self.glyphs = {}
+        for char, bits in self.charLookup.items():
+            #every glyph needs exactly one bit for each of the 8 segments
+            assert len(bits) == 8 and set(bits) <= {"0", "1"}, f"glyph for {char!r} must be 8 bits"
+            glyph = 0
+            for i in range(8):
+                glyph |= int(bits[i]) << segment_pins[i]
+            #the character on its own, and with the decimal point segment lit
+            for key, lit in ((char, glyph), (char + ".", glyph | decimal_bit)):
+                #a common anode segment is lit by tying it low, so invert the segment bits once here
+                if self.common_anode:
+                    lit ^= self.segment_mask
+                self.glyphs[key] = lit
+
+    def write_image(self, mask, bits):
+        """
+        INPUT:
+        - self representing an instance of the class
+        - mask representing which pins are being written, bit n representing pin n
+        - bits representing the level each of those pins should be written to
+
+        OUTPUT:
+        - if the display is connected to a bitshift, a single masked update of its register image
+        - otherwise every pin in the mask is written individually
+        """
+        if self.bitshift:
+            self.board.write_mask(mask, bits)
+            return
+        while mask:
+            #lowest pin left in the mask
+            low = mask & -mask
+            self.board.digital_pin_write(low.bit_length() - 1, 1 if bits & low else 0)
+            mask ^= low
+
     def initialise_pins(self):
         """
         Initialises all of the pins used by the 8-segment display to digital outputs
@@ -93,23 +323,15 @@ class Segment_Display():
         - self representing and instance of the class
 
         OUTPUT
-        - a segment display that has all of it's pins set to digital outputs
-        - if segment display is connected to a bitshift, this will be ignored
+        - a segment display that has all of it's pins set to digital outputs, in as few transfers as the board allows
+        - if segment display is connected to a bitshift, this will be ignored, as the bitshift sets up its own pins
         """
-        #for all 12 pins used in 8-segment display, set as digital output
-        #all this does is just get the first pin of the digit_pins and the 
-        #last pin of the segment_pins and increment through them
-
-        #try to initialise digital pins, if it doesn't let you, it means the segment display is being interfaced through a bitshift register
-        try:
-            for i in range(list(self.digit_pins.values())[0],list(self.segment_pins.values())[-1] + 1 ):
-                #initialise pin as digital output
-                self.board.set_pin_mode_digital_output(i)
-        except:
-            #print to console to let us know that the eight segment is being interfaced through a bitshift
-            print("EIGHT SEGMENT INTERFACED THROUGH BITSHIFT")
-        
+        if self.bitshift:
+            return
+        #all 12 pins used in 8-segment display are set as digital outputs
+        setup_output_pins(self.board, list(self.digit_pins.values()) + list(self.segment_pins.values()), 0)
 
+    @traced
     def reset_display(self, index = None):
         """
         INPUT:
@@ -118,32 +340,31 @@ class Segment_Display():
             - if index is None, reset all digits
         
         OUTPUT:
-        the display digit pin being tied to high (5v), therefore disabling it
+        the display digit pin being tied to high (5v), or low for a common anode display, therefore disabling it
 
-        if Index = None, resets all digits of the display, by writing 1 to their pins. Otherwise, only reset the specific digit specified
+        if Index = None, resets all digits of the display, by writing their off level to their pins. Otherwise, only reset the specific digit specified
         """
-        #set all digit pins to 1, essentially turning them off
+        #set all digit pins to their off level, essentially turning them off
         #if index is None, reset all digits, otherwise reset specific digit
         if index is None:
-            #for every digits pin
-            for digit in range(len(self.digit_pins.values())):
-                self.board.digital_pin_write(list(self.digit_pins.values())[digit],1)
+            mask = sum(self.digit_masks)
         else:
-            self.board.digital_pin_write(self.digit_pins[str(index)],1)
+            mask = self.digit_masks[index]
+        self.write_image(mask, self.digit_off)
 
+    @traced
     def reset_segment(self):
         """
         INPUT: self representing an instance of the class
 
-        OUTPUT: all segment pins of the given segment display being tied to ground
+        OUTPUT: all segment pins of the given segment display being tied to ground, or high for a common anode display
         
-        Resets all segment pins, writing them to 0 (tying to ground)
+        Resets all segment pins, writing them to their off level
         """
-        #for every segment pin
-        for i in range(len(self.segment_pins.values())):
-            #set segment to 0
-            self.board.digital_pin_write(list(self.segment_pins.values())[i],0)
+        #set every segment to its off level
+        self.write_image(self.segment_mask, self.segment_off)
 
+    @traced
     def print_char(self, char, index):
         """
         INPUT:
@@ -161,21 +382,58 @@ class Segment_Display():
 
         #convert character to lower case (adds robustness)
         char = char.lower()
-        #reset digit (set all segments to 0)
-        self.reset_segment()
-        #reset display to 1
-        self.reset_display(index)
+        self.print_glyph(self.glyphs[char], index)
 
-        #set chosen digit to 0 (enabling it)
-        self.board.digital_pin_write(self.digit_pins[str(index)],0)
-        #for every segment
-        for i in range(8):
-            #check lookup table, set pin to 1 if needs to be enabled
-            self.board.digital_pin_write(list(self.segment_pins.values())[i],int(self.charLookup[str(char)[0]][i]))
-        #if there is a decimal in the given character, that tie the decimal segment pin to high
-        if "." in char:
-            self.board.digital_pin_write(self.segment_pins["dec"],1)
-        
+    @traced
+    def print_glyph(self, glyph, index):
+        """
+        INPUT:
+        - self representing an instance of the class
+        - glyph representing a compiled glyph from self.glyphs
+        - index representing which position on the display you want to display the glyph on
+
+        OUTPUT:
+        - the segments are set to glyph and the digit at index is enabled
+        """
+        digit_mask = self.digit_masks[index]
+
+        if self.bitshift:
+            #the segments and the chosen digit are updated in the register image at once
+            self.write_image(self.segment_mask | digit_mask, glyph | (self.digit_on & digit_mask))
+        else:
+            #disable the digit while its segments change, so the previous character doesn't flash on it
+            self.write_image(digit_mask, self.digit_off)
+            #set every segment from the compiled glyph, as one frame if the board can coalesce writes. A frame only keeps the last level
+            #of every pin and sends them port by port, so the digit is switched off before it and on after it, never inside it
+            frame = getattr(self.board, "frame", None)
+            with frame() if frame is not None else nullcontext():
+                self.write_image(self.segment_mask, glyph)
+            #set chosen digit to its on level (enabling it), once the segments are sent
+            self.write_image(digit_mask, self.digit_on)
+
+    @staticmethod
+    def split_characters(text):
+        """
+        INPUT:
+        - text representing a word or sentence
+
+        OUTPUT:
+        - a list of the characters in text, where every character followed by a decimal point is joined with it (e.g. "1.5" -> ["1.", "5"])
+
+        this is needed so that if there are decimal points, they can be displayed on the same digit as the character before them
+        """
+        characters = []
+        i = 0
+        while i < len(text):
+            if i + 1 < len(text) and text[i+1] == ".":
+                characters.append(text[i:i+2])
+                i += 1
+            else:
+                characters.append(text[i])
+            i += 1
+        return characters
+
+    @traced
     def print_word(self, word):
         """
         INPUT:
@@ -188,18 +446,8 @@ class Segment_Display():
         #the length of the word must be <= 4, not including the decimal points
         assert len(word) - word.count(".") <= 4 , "length of word must be <= 4 (not including decimal points)"
 
-        #declare variables list
-        characters = []
-        i = 0
-        #this section of code basically takes all characters in the word, and joins them to their corresponding decimal point if there is one
-        #this is needed so that if there are decimal points, so they can be displayed to the appropriate digit
-        while i < len(word):
-            if i + 1 < len(word) and word[i+1] == ".":
-                characters.append(word[i:i+2])
-                i += 1
-            else:
-                characters.append(word[i])
-            i += 1
+        #join every character with it's decimal point if there is one
+        characters = self.split_characters(word)
 
         #reset segments (set all segments to 1)
         self.reset_segment()
@@ -211,66 +459,386 @@ class Segment_Display():
         for index in range(-1,-len(characters) - 1,-1):
             #print the character to it's index
             self.print_char(characters[index],-index - 1)
-            #try to run the shift out method, it will execute if the eight segment is connected to a bitshift register, otherwise it will not
-            try:
+            #shift the image out if the eight segment is connected to a bitshift register, direct pins are already written
+            if self.bitshift:
                 self.board.shift_out()
-            except:
-                pass
             #reset the entire display (this removes the character, but it runs so quickly it can still be seen)
             self.reset_display(-index-1)
 
-    def rolling_sentence(self, sentence):
+    def compile_text(self, characters):
+        """
+        INPUT:
+        - self representing an instance of the class
+        - characters representing at most 4 characters, as returned by split_characters
+
+        OUTPUT:
+        - a framebuffer, a tuple of the 4 compiled glyphs with the last character on digit 0, None being used for blank digits
+        """
+        #pad with blanks on the left so the last character lands on digit 0
+        characters = [" "] * (4 - len(characters)) + list(characters)
+        return tuple(None if char == " " else self.glyphs[char.lower()] for char in reversed(characters))
+
+    def set_text(self, text):
+        """
+        INPUT:
+        - self representing an instance of the class
+        - text representing the word that should be shown, it must be length 4 or less (not including decimal points)
+
+        OUTPUT:
+        - the framebuffer is replaced with text, right aligned. Nothing is written to the board here, the text is shown by the refresher
+        """
+        characters = self.split_characters(text)
+        assert len(characters) <= 4, "length of text must be <= 4 (not including decimal points)"
+
+        #replace the framebuffer in one assignment so the refresher never sees a half written frame
+        self.framebuffer = self.compile_text(characters)
+
+    @property
+    def framebuffer(self):
+        """
+        The compiled glyph shown on each digit, index 0 being the rightmost digit. When the board is scanning, assigning a new
+        framebuffer uploads it
+        """
+        return self._framebuffer
+
+    @framebuffer.setter
+    def framebuffer(self, framebuffer):
+        self._framebuffer = framebuffer
+        if self.board_scanning:
+            self.upload_frame()
+
+    def frame_images(self, framebuffer):
+        """
+        INPUT:
+        - self representing an instance of the class
+        - framebuffer representing a framebuffer to be scanned by the board
+
+        OUTPUT:
+        - a list with the image of the whole bitshift chain for every lit digit, that digit being enabled and showing its glyph while
+          every other digit is disabled. A blank framebuffer gives a single image with every digit disabled
+        """
+        digit_mask = sum(self.digit_masks)
+        mask = self.segment_mask | digit_mask
+        images = []
+        for index, glyph in enumerate(framebuffer):
+            if glyph is None:
+                continue
+            enabled = self.digit_masks[index]
+            images.append(self.board.image_with(mask, glyph | (self.digit_on & enabled) | (self.digit_off & (digit_mask ^ enabled))))
+        if not images:
+            images.append(self.board.image_with(mask, self.segment_off | self.digit_off))
+        return images
+
+    def upload_frame(self):
+        """
+        INPUT:
+        - self representing an instance of the class
+
+        OUTPUT:
+        - if the framebuffer has changed since it was last uploaded, its images are sent to the board in one message, each held long
+          enough for every digit to be shown board_refresh_hz times a second
+        """
+        with self.lock:
+            framebuffer = self._framebuffer
+            if framebuffer == self.uploaded:
+                return
+            images = self.frame_images(framebuffer)
+            self.board.upload_frame(images, max(1, round(1000 / (self.board_refresh_hz * len(images)))))
+            self.uploaded = framebuffer
+
+    #how many compiled sentences are kept
+    SENTENCE_CACHE_SIZE = 16
+
+    def compile_sentence(self, sentence):
+        """
+        INPUT:
+        - self representing an instance of the class
+        - sentence representing a sentence that wants to be scrolled across the display
+
+        OUTPUT:
+        - a tuple of framebuffers, one for every scroll step. The sentence enters from the right, one character per step, and the last
+          steps are blank so the display is cleared at the end
+        - the result is cached, so compiling the same sentence again returns the same tuple
+        """
+        key = sentence.lower()
+        frames = self.sentence_cache.get(key)
+        if frames is not None:
+            return frames
+
+        characters = self.split_characters(sentence)
+        #4 blanks before and after, so every step is just a window of 4 characters
+        padded = [" "] * 4 + characters + [" "] * 4
+        frames = tuple(self.compile_text(padded[step + 1:step + 5]) for step in range(len(characters) + 5))
+
+        #forget the oldest sentence once the cache is full
+        if len(self.sentence_cache) >= self.SENTENCE_CACHE_SIZE:
+            del self.sentence_cache[next(iter(self.sentence_cache))]
+        self.sentence_cache[key] = frames
+        return frames
+
+    @traced
+    def scan(self, framebuffer = None):
+        """
+        INPUT:
+        - self representing an instance of the class
+        - framebuffer representing the framebuffer to show, self.framebuffer if it isn't given
+
+        OUTPUT:
+        - every digit of the framebuffer is shown once, one after another, blank digits are skipped
+        """
+        if framebuffer is None:
+            framebuffer = self.framebuffer
+        with self.lock:
+            for index in range(4):
+                if framebuffer[index] is None:
+                    continue
+                self.print_glyph(framebuffer[index], index)
+                #shift the image out if the eight segment is connected to a bitshift register, direct pins are already written
+                if self.bitshift:
+                    self.board.shift_out()
+                #reset the digit so the next one can be written
+                self.reset_display(index)
+
+    #default refresh rate of the display, and default speed text is scrolled at
+    REFRESH_HZ = 50
+    SCROLL_SPEED = 4
+
+    def play_frames(self, frame_at, duration, refresh_hz = REFRESH_HZ):
+        """
+        INPUT:
+        - self representing an instance of the class
+        - frame_at representing a function that is given the number of seconds since starting and returns the framebuffer to show
+        - duration representing how many seconds to play for
+        - refresh_hz representing how many times per second the frame is updated (and scanned, if the refresher isn't running)
+
+        OUTPUT:
+        - the framebuffer given by frame_at is shown until duration has passed. If the refresher (or the board) is running it does the
+          scanning and only the framebuffer is swapped, otherwise the frames are scanned here
+        - the frame is picked from the clock, so if a scan overruns, the frames it should have shown are dropped rather than delayed
+        """
+        period = 1 / refresh_hz
+        start = time.monotonic()
+        deadline = start
+        while True:
+            elapsed = time.monotonic() - start
+            if elapsed >= duration:
+                break
+            framebuffer = frame_at(elapsed)
+            if self.refresher.running or self.board_scanning:
+                self.framebuffer = framebuffer
+            else:
+                self.scan(framebuffer)
+            deadline += period
+            delay = deadline - time.monotonic()
+            if delay > 0:
+                time.sleep(min(delay, max(0, start + duration - time.monotonic())))
+            else:
+                deadline = time.monotonic()
+
+    def scroll_text(self, sentence, chars_per_second = SCROLL_SPEED, refresh_hz = REFRESH_HZ):
+        """
+        INPUT:
+        - self representing an instance of the class
+        - sentence representing a sentence that wants to be scrolled across the display
+        - chars_per_second representing how many characters the sentence moves along every second
+        - refresh_hz representing how many times per second the display is updated
+
+        OUTPUT:
+        - the sentence is scrolled across the display, taking the same amount of time however fast the link is
+        """
+        frames = self.compile_sentence(sentence)
+        last = len(frames) - 1
+        self.play_frames(lambda elapsed: frames[min(int(elapsed * chars_per_second), last)], len(frames) / chars_per_second, refresh_hz)
+
+    def show_text(self, text, dwell, refresh_hz = REFRESH_HZ):
+        """
+        INPUT:
+        - self representing an instance of the class
+        - text representing the word that should be shown, it must be length 4 or less (not including decimal points)
+        - dwell representing how many seconds it is shown for
+        - refresh_hz representing how many times per second the display is updated
+
+        OUTPUT:
+        - text is shown for dwell seconds, and is left in the framebuffer afterwards
+        """
+        self.set_text(text)
+        framebuffer = self.framebuffer
+        self.play_frames(lambda elapsed: framebuffer, dwell, refresh_hz)
+
+    def start_refresh(self, refresh_hz = REFRESH_HZ):
+        """
+        INPUT:
+        - self representing an instance of the class
+        - refresh_hz representing how many times per second the whole framebuffer is scanned onto the display
+
+        OUTPUT:
+        - a daemon thread is started which scans the framebuffer at a steady rate until stop_refresh() is called
+        """
+        #only one refresher can run at a time
+        self.refresher.start(refresh_hz)
+
+    def start_board_refresh(self, refresh_hz = REFRESH_HZ):
+        """
+        INPUT:
+        - self representing an instance of the class
+        - refresh_hz representing how many times per second the board scans the whole framebuffer
+
+        OUTPUT:
+        - the framebuffer is uploaded, and uploaded again whenever it changes, until stop_refresh() is called. No thread is started
+        """
+        assert hasattr(self.board, "upload_frame"), "board scanning needs the display to be connected to a bitshift"
+        if self.refresher.running or self.board_scanning:
+            return
+        self.board_refresh_hz = refresh_hz
+        self.uploaded = None
+        self.board_scanning = True
+        self.upload_frame()
+
+    @traced
+    def stop_refresh(self):
+        """
+        INPUT:
+        - self representing an instance of the class
+
+        OUTPUT:
+        - the refresher thread is stopped (or the board stops scanning), and the display is reset so nothing is left showing
+        """
+        if self.board_scanning:
+            #a single blank image stops the board scanning
+            with self.lock:
+                self.board_scanning = False
+                self.board.upload_frame(self.frame_images((None, None, None, None)), 1)
+                self.uploaded = None
+            return
+        if not self.refresher.stop():
+            return
+        self.reset_display()
+        #on a bitshift the reset only changes the register image, the digit last scanned stays latched until it is shifted out
+        if self.bitshift:
+            self.board.shift_out()
+
+    def request_refresh(self):
+        """
+        INPUT:
+        - self representing an instance of the class
+
+        OUTPUT:
+        - if the refresher is running, it is woken to scan straight away instead of waiting for its next slot, otherwise the framebuffer
+          is scanned here
+        """
+        if self.board_scanning:
+            #the board already shows the framebuffer as soon as it is set
+            return
+        if self.refresher.running:
+            self.refresher.request()
+        else:
+            self.scan()
+
+    def wait_for_scan(self, timeout = None):
+        """
+        INPUT:
+        - self representing an instance of the class
+        - timeout representing the maximum number of seconds to wait, None meaning no limit
+
+        OUTPUT:
+        - blocks until the refresher has finished a scan that started after this was called, so whatever was in the framebuffer at the
+          time of the call has been shown. True if it was, False if the timeout ran out first or the refresher isn't running
+        """
+        if self.board_scanning:
+            #the framebuffer was uploaded when it was set, so the board is already scanning it
+            return True
+        return self.refresher.wait_for_scan(timeout)
+
+    def rolling_sentence(self, sentence, chars_per_second = SCROLL_SPEED):
         """
         INPUT:
         - self representing an instance of the class
         - sentence representing a sentence that wants to be displayed
+        - chars_per_second representing how fast the sentence moves
 
         Takes a sentence as input and rolls it across the display. Once the entire sentence has been written, it writes an additional 4 spaces to clear the entire display
         """
-        #declare variables list
-        characters = []
-        i = 0
-        #this section of code basically takes all characters in the word, and joins them to their corresponding decimal point if there is one
-        #this is needed so that if there are decimal points, it can be displayed to the appropriate digit
-        while i < len(sentence):
-            if i + 1 < len(sentence) and sentence[i+1] == ".":
-                characters.append(sentence[i:i+2])
-                i += 1
-            else:
-                characters.append(sentence[i])
-            i += 1
-        
-        #for every letter of sentence
-        for char in range(len(characters) + 5):
-            
-            #this for loop just increases the amount of time the digit is shown on screen for, so that it moves slower
-            for _ in range(7):
-                #for every digit of display
-                for i in range(4):
-                    #This code basically checks if the current digit should be displayed to the screen, and at what position
-                    #if no character is meant to be displayed at that particular index, then " " is written, which is all 0's
-                    if (char - i) < 0 or (char - i >= len(characters)):
-                        self.print_char(" ",i)
-                        #try to run the shift out method, it will execute if the eight segment is connected to a bitshift register, otherwise it will not
-                        try:
-                            self.board.shift_out()
-                        except:
-                            pass
-                        #reset display so next digit can be written
-                        self.reset_display(i)
-                    else:
-                        self.print_char(characters[char - i],i)
-                        #try to run the shift out method, it will execute if the eight segment is connected to a bitshift register, otherwise it will not
-                        try:
-                            self.board.shift_out()
-                        except:
-                            pass
-                        #reset display so next digit can be written
-                        self.reset_display(i)
+        #every scroll step is compiled once (and cached), and each step is shown for a fixed amount of time
+        self.scroll_text(sentence, chars_per_second)
+
+class DisplayGroup():
+    """
+    This class scans several segment displays that share one bitshift chain, each display being connected to a RegisterView claimed
+    from the same BitShift
+
+    Digit n of every display is written into the shared image and the chain is shifted out once, so a whole group is refreshed with 4
+    shifts per scan however many displays are in it, instead of 4 for every display. The group has its own refresher, the displays'
+    own refreshers should not be started. Text is still set on each display with set_text()
+    """
+    def __init__(self, displays: list) -> None:
+        #every display must be on a view of the same bus
+        assert len(displays) > 0, "a display group needs at least one display"
+        buses = {id(getattr(display.board, "bus", None)) for display in displays}
+        assert len(buses) == 1 and getattr(displays[0].board, "bus", None) is not None, "every display must be on a view of the same bitshift"
+
+        self.displays = list(displays)
+        self.bus = displays[0].board.bus
+
+        self.lock = threading.RLock()
+
+        #background refresher thread scanning the group, recording the same metrics a single display does
+        self.refresher = Refresher(self.scan)
+
+    @traced
+    def scan(self):
+        """
+        INPUT:
+        - self representing an instance of the class
+
+        OUTPUT:
+        - digit n of every display is shown at the same time, with one shift out for each digit. Digits that are blank on every display
+          are skipped
+        """
+        #take every framebuffer once, so a display whose text changes during the scan is still shown consistently
+        framebuffers = [display.framebuffer for display in self.displays]
+        with self.lock:
+            for index in range(4):
+                lit = [(display, framebuffer[index]) for display, framebuffer in zip(self.displays, framebuffers) if framebuffer[index] is not None]
+                if not lit:
+                    continue
+                for display, glyph in lit:
+                    display.print_glyph(glyph, index)
+                self.bus.shift_out()
+                #reset the digit so the next one can be written
+                for display, glyph in lit:
+                    display.reset_display(index)
+
+    def start_refresh(self, refresh_hz = Segment_Display.REFRESH_HZ):
+        """
+        INPUT:
+        - self representing an instance of the class
+        - refresh_hz representing how many times per second every display of the group is scanned
+
+        OUTPUT:
+        - a daemon thread is started which scans the group at a steady rate until stop_refresh() is called
+        """
+        self.refresher.start(refresh_hz)
+
+    @traced
+    def stop_refresh(self):
+        """
+        INPUT:
+        - self representing an instance of the class
+
+        OUTPUT:
+        - the refresher thread is stopped, and every display is reset so nothing is left showing
+        """
+        if not self.refresher.stop():
+            return
+        for display in self.displays:
+            display.reset_display()
+        self.bus.shift_out()
+
 if __name__ == "__main__":
     """
     Tester code
     """
+    from pymata4 import pymata4
     board = pymata4.Pymata4()
     seg = Segment_Display(board)
     
@@ -0,0 +1,213 @@
+######################################################################
+# RAW FIRMATA COMMANDS
+######################################################################
+#these values are taken from FirmataExpress.h, they are used when a whole batch of commands is encoded by us
+#and handed to the board as a single transfer instead of one pymata4 call per command
+SET_DIGITAL_PIN_VALUE = 0xF5
+#writes all 8 pins of a port at once, the port number is added to this value
+DIGITAL_MESSAGE = 0x90
+SET_PIN_MODE = 0xF4
+START_SYSEX = 0xF0
+END_SYSEX = 0xF7
+
+#pin modes used with SET_PIN_MODE
+INPUT = 0x00
+OUTPUT = 0x01
+PULLUP = 0x0B
+
+def encode_pin_writes(writes):
+    """
+    Encodes a sequence of digital pin writes as back to back SET_DIGITAL_PIN_VALUE commands
+
+    INPUT:
+    - writes representing an ordered iterable of (pin, value) pairs
+
+    OUTPUT:
+    - a bytes object that can be written to the serial link in one go, the firmware executes the writes in the same order
+    """
+    message = bytearray()
+    for pin, value in writes:
+        message += bytes((SET_DIGITAL_PIN_VALUE, pin, value))
+    return bytes(message)
+
+def send_pin_writes(board, writes):
+    """
+    Sends a sequence of digital pin writes to the board in a single transfer
+
+    INPUT:
+    - board representing an instantiated pymata4 board (or anything that implements _send_command)
+    - writes representing an ordered iterable of (pin, value) pairs
+
+    OUTPUT:
+    - every write is sent to the board inside one serial write rather than one write per pin
+    - if the board is a proxy that keeps track of pin levels, it is given the writes so it can do the same
+    """
+    if hasattr(board, "digital_pin_write_many"):
+        board.digital_pin_write_many(writes)
+    else:
+        board._send_command(encode_pin_writes(writes))
+
+def encode_pin_modes(pins, mode):
+    """
+    Encodes back to back SET_PIN_MODE commands setting every pin in pins to mode
+    """
+    message = bytearray()
+    for pin in pins:
+        message += bytes((SET_PIN_MODE, pin, mode))
+    return bytes(message)
+
+def setup_output_pins(board, pins, level = 0):
+    """
+    Sets several pins as digital outputs and writes level to all of them
+
+    INPUT:
+    - board representing an instantiated pymata4 board (or a proxy of one)
+    - pins representing the pins to set up
+    - level representing the level every pin starts at
+
+    OUTPUT:
+    - if the board accepts raw commands, every pin mode is sent in one transfer and the levels in another, otherwise the pins are set
+      up one pymata4 call at a time
+    """
+    pins = list(pins)
+    if hasattr(board, "_send_command"):
+        board._send_command(encode_pin_modes(pins, OUTPUT))
+        send_pin_writes(board, [(pin, level) for pin in pins])
+        return
+    for pin in pins:
+        board.set_pin_mode_digital_output(pin)
+    for pin in pins:
+        board.digital_pin_write(pin, level)
+
+######################################################################
+# DEAD MANS SWITCH SYSEX COMMANDS
+######################################################################
+#these commands are not part of FirmataExpress, they are handled by the extension in firmware/dms_extensions.h
+#0x01 - 0x0F are reserved by the Firmata protocol for user defined commands
+BUZZER_SEQUENCE = 0x01
+
+#the firmware stores at most this many steps of a buzzer sequence
+MAX_SEQUENCE_STEPS = 20
+
+def encode_14bit(value):
+    """
+    Splits a value into the two 7 bit bytes used by sysex data (least significant byte first)
+    """
+    assert 0 <= value < 1 << 14, "value must fit in 14 bits"
+    return [value & 0x7F, (value >> 7) & 0x7F]
+
+def encode_buzzer_sequence(pin, pattern, repeat):
+    """
+    Encodes a buzzer pattern as the data of a BUZZER_SEQUENCE sysex message
+
+    INPUT:
+    - pin representing the pin the buzzer is connected to
+    - pattern representing a list of (level, duration) steps, duration being in seconds, an empty pattern stops the buzzer
+    - repeat representing how many times the board plays the pattern, 0 meaning until it is told to stop
+
+    OUTPUT:
+    - a list of 7 bit data bytes, [pin, repeat lsb, repeat msb] followed by [level, duration lsb, duration msb] for every step,
+      durations being in milliseconds. Steps longer than the 14 bit limit are split into several steps of the same level
+    """
+    data = [pin] + encode_14bit(repeat)
+    steps = 0
+    for level, duration in pattern:
+        milliseconds = round(duration * 1000)
+        #a step always gets at least one entry, even if it lasts 0ms, so the level is still written
+        while True:
+            chunk = min(milliseconds, (1 << 14) - 1)
+            data += [int(level)] + encode_14bit(chunk)
+            steps += 1
+            milliseconds -= chunk
+            if milliseconds <= 0:
+                break
+    assert steps <= MAX_SEQUENCE_STEPS, f"buzzer sequences are limited to {MAX_SEQUENCE_STEPS} steps"
+    return data
+
+#upload of the register images a bitshift cycles through, so the board scans a display by itself
+DISPLAY_FRAME = 0x02
+
+#the firmware stores at most this many images, of a chain of at most this many registers
+MAX_FRAME_IMAGES = 8
+MAX_FRAME_REGISTERS = 4
+
+def encode_display_frame(latch_pin, data_pin, clock_pin, register_count, images, period):
+    """
+    Encodes the images of a display frame as the data of a DISPLAY_FRAME sysex message
+
+    INPUT:
+    - latch_pin, data_pin and clock_pin representing the pins of the bitshift chain
+    - register_count representing how many registers are in the chain
+    - images representing the images of the chain the board cycles through, bit i of an image being output i of the chain. A single
+      image is shifted out once and held, so uploading a blank image stops the scanning
+    - period representing how many milliseconds each image is held for
+
+    OUTPUT:
+    - a list of 7 bit data bytes, [latch, data, clock, register count, period lsb, period msb] followed by every image, least
+      significant 7 bits first
+    """
+    assert 0 < register_count <= MAX_FRAME_REGISTERS, f"board scanning supports chains of up to {MAX_FRAME_REGISTERS} registers"
+    assert 0 < len(images) <= MAX_FRAME_IMAGES, f"a display frame must have between 1 and {MAX_FRAME_IMAGES} images"
+    data = [latch_pin, data_pin, clock_pin, register_count] + encode_14bit(period)
+    for image in images:
+        data += encode_image(image, register_count)
+    return data
+
+def encode_image(image, register_count):
+    """
+    OUTPUT:
+    - the image of a chain of register_count registers as 7 bit data bytes, least significant 7 bits first
+    """
+    assert 0 <= image < 1 << (8 * register_count), "image must fit in the chain"
+    return [(image >> shift) & 0x7F for shift in range(0, 8 * register_count, 7)]
+
+def decode_image(data):
+    """
+    Reverses encode_image
+    """
+    image = 0
+    for i, byte in enumerate(data):
+        image |= byte << (7 * i)
+    return image
+
+def decode_display_frame(data):
+    """
+    Reverses encode_display_frame
+
+    OUTPUT:
+    - (latch pin, data pin, clock pin, register count, list of images, period in milliseconds)
+    """
+    latch_pin, data_pin, clock_pin, register_count = data[:4]
+    period = data[4] | (data[5] << 7)
+    size = -(-8 * register_count // 7)
+    images = [decode_image(data[start:start + size]) for start in range(6, len(data) - size + 1, size)]
+    return latch_pin, data_pin, clock_pin, register_count, images, period
+
+#a single image shifted out and latched by the board, in place of the two or three pin writes per bit of a bulk shift
+SHIFT_OUT = 0x03
+
+def encode_shift_out(latch_pin, data_pin, clock_pin, register_count, image):
+    """
+    Encodes an image as the data of a SHIFT_OUT sysex message
+
+    INPUT:
+    - latch_pin, data_pin and clock_pin representing the pins of the bitshift chain
+    - register_count representing how many registers are in the chain
+    - image representing the image of the chain, bit i being output i
+
+    OUTPUT:
+    - a list of 7 bit data bytes, [latch, data, clock, register count] followed by the image, least significant 7 bits first. For a
+      chain of 2 registers the whole message is 10 bytes on the link, against around 100 for the same shift as pin writes
+    """
+    assert 0 < register_count <= MAX_FRAME_REGISTERS, f"board shifting supports chains of up to {MAX_FRAME_REGISTERS} registers"
+    return [latch_pin, data_pin, clock_pin, register_count] + encode_image(image, register_count)
+
+def decode_shift_out(data):
+    """
+    Reverses encode_shift_out
+
+    OUTPUT:
+    - (latch pin, data pin, clock pin, register count, image)
+    """
+    latch_pin, data_pin, clock_pin, register_count = data[:4]
+    return latch_pin, data_pin, clock_pin, register_count, decode_image(data[4:])
@@ -0,0 +1,224 @@
+/*
+ * Dead-Mans-Switch extensions for FirmataExpress
+ *
+ * These add sysex commands that let the host hand work to the board instead of timing it over the serial link.
+ * They are matched by the constants in firmata_commands.py.
+ *
+ * To install:
+ *  1. copy this file next to FirmataExpress.ino
+ *  2. add  #include "dms_extensions.h"  after the other includes in FirmataExpress.ino
+ *  3. in sysexCallback(), add the cases below to the switch on command:
+ *         case BUZZER_SEQUENCE:
+ *           dmsBuzzerSequence(argc, argv);
+ *           break;
+ *         case DISPLAY_FRAME:
+ *           dmsDisplayFrame(argc, argv);
+ *           break;
+ *         case SHIFT_OUT:
+ *           dmsShiftOut(argc, argv);
+ *           break;
+ *  4. call dmsUpdate(); at the start of loop()
+ */
+#ifndef DMS_EXTENSIONS_H
+#define DMS_EXTENSIONS_H
+
+#define BUZZER_SEQUENCE 0x01
+
+#define DMS_MAX_SEQUENCE_STEPS 20
+
+#define DISPLAY_FRAME 0x02
+
+#define DMS_MAX_FRAME_IMAGES 8
+#define DMS_MAX_FRAME_REGISTERS 4
+
+#define SHIFT_OUT 0x03
+
+/*
+ * BUZZER_SEQUENCE
+ *
+ * data: pin, repeat (14 bit), then level, duration in ms (14 bit) for every step
+ * the pattern is played repeat times (0 repeats until the next sequence), an empty pattern turns the buzzer off
+ */
+struct {
+  byte pin;
+  unsigned int repeat;
+  byte steps;
+  byte levels[DMS_MAX_SEQUENCE_STEPS];
+  unsigned int durations[DMS_MAX_SEQUENCE_STEPS];
+  byte step;
+  unsigned int played;
+  unsigned long stepStart;
+  bool active;
+} dmsBuzzer;
+
+void dmsBuzzerStop() {
+  if (dmsBuzzer.active) {
+    digitalWrite(dmsBuzzer.pin, LOW);
+  }
+  dmsBuzzer.active = false;
+}
+
+void dmsBuzzerSequence(byte argc, byte *argv) {
+  if (argc < 3) {
+    return;
+  }
+  dmsBuzzerStop();
+  dmsBuzzer.pin = argv[0];
+  dmsBuzzer.repeat = argv[1] | (argv[2] << 7);
+  dmsBuzzer.steps = 0;
+  unsigned long total = 0;
+  for (byte i = 3; i + 2 < argc && dmsBuzzer.steps < DMS_MAX_SEQUENCE_STEPS; i += 3) {
+    dmsBuzzer.levels[dmsBuzzer.steps] = argv[i];
+    dmsBuzzer.durations[dmsBuzzer.steps] = argv[i + 1] | (argv[i + 2] << 7);
+    total += dmsBuzzer.durations[dmsBuzzer.steps];
+    dmsBuzzer.steps++;
+  }
+  /* a pattern with no duration can only be played once */
+  if (total == 0) {
+    dmsBuzzer.repeat = 1;
+  }
+  if (dmsBuzzer.steps == 0) {
+    digitalWrite(dmsBuzzer.pin, LOW);
+    return;
+  }
+  dmsBuzzer.step = 0;
+  dmsBuzzer.played = 0;
+  dmsBuzzer.stepStart = millis();
+  dmsBuzzer.active = true;
+  digitalWrite(dmsBuzzer.pin, dmsBuzzer.levels[0] ? HIGH : LOW);
+}
+
+void dmsBuzzerUpdate() {
+  if (!dmsBuzzer.active) {
+    return;
+  }
+  unsigned long now = millis();
+  /* several short steps may have elapsed since the last call */
+  while (now - dmsBuzzer.stepStart >= dmsBuzzer.durations[dmsBuzzer.step]) {
+    dmsBuzzer.stepStart += dmsBuzzer.durations[dmsBuzzer.step];
+    dmsBuzzer.step++;
+    if (dmsBuzzer.step == dmsBuzzer.steps) {
+      dmsBuzzer.step = 0;
+      dmsBuzzer.played++;
+      if (dmsBuzzer.repeat != 0 && dmsBuzzer.played >= dmsBuzzer.repeat) {
+        dmsBuzzerStop();
+        return;
+      }
+    }
+    digitalWrite(dmsBuzzer.pin, dmsBuzzer.levels[dmsBuzzer.step] ? HIGH : LOW);
+  }
+}
+
+/*
+ * DISPLAY_FRAME
+ *
+ * data: latch pin, data pin, clock pin, register count, period in ms (14 bit), then every image of the chain, least significant 7 bits
+ * first. the images are shifted out one after another, each held for period ms, until the next frame. a single image is shifted out
+ * once and held, so a blank image stops the scanning
+ */
+struct {
+  byte latchPin;
+  byte dataPin;
+  byte clockPin;
+  byte bits;
+  unsigned int period;
+  byte images;
+  unsigned long image[DMS_MAX_FRAME_IMAGES];
+  byte step;
+  unsigned long stepStart;
+  bool active;
+} dmsDisplay;
+
+void dmsShiftImage(byte latchPin, byte dataPin, byte clockPin, byte bits, unsigned long image) {
+  digitalWrite(latchPin, LOW);
+  /* most significant output first, the same order as BitShift.frame_writes() */
+  for (int bit = bits - 1; bit >= 0; bit--) {
+    digitalWrite(dataPin, (image >> bit) & 1 ? HIGH : LOW);
+    digitalWrite(clockPin, HIGH);
+    digitalWrite(clockPin, LOW);
+  }
+  digitalWrite(latchPin, HIGH);
+}
+
+void dmsDisplayShift(unsigned long image) {
+  dmsShiftImage(dmsDisplay.latchPin, dmsDisplay.dataPin, dmsDisplay.clockPin, dmsDisplay.bits, image);
+}
+
+void dmsDisplayFrame(byte argc, byte *argv) {
+  if (argc < 6 || argv[3] == 0 || argv[3] > DMS_MAX_FRAME_REGISTERS) {
+    return;
+  }
+  dmsDisplay.latchPin = argv[0];
+  dmsDisplay.dataPin = argv[1];
+  dmsDisplay.clockPin = argv[2];
+  dmsDisplay.bits = argv[3] * 8;
+  dmsDisplay.period = argv[4] | (argv[5] << 7);
+  byte size = (dmsDisplay.bits + 6) / 7;
+  dmsDisplay.images = 0;
+  for (byte i = 6; i + size <= argc && dmsDisplay.images < DMS_MAX_FRAME_IMAGES; i += size) {
+    unsigned long image = 0;
+    for (byte j = 0; j < size; j++) {
+      image |= (unsigned long)argv[i + j] << (7 * j);
+    }
+    dmsDisplay.image[dmsDisplay.images++] = image;
+  }
+  if (dmsDisplay.images == 0) {
+    dmsDisplay.active = false;
+    return;
+  }
+  pinMode(dmsDisplay.latchPin, OUTPUT);
+  pinMode(dmsDisplay.dataPin, OUTPUT);
+  pinMode(dmsDisplay.clockPin, OUTPUT);
+  dmsDisplay.step = 0;
+  dmsDisplay.stepStart = millis();
+  dmsDisplayShift(dmsDisplay.image[0]);
+  /* a single image stays latched without any more work */
+  dmsDisplay.active = dmsDisplay.images > 1;
+}
+
+void dmsDisplayUpdate() {
+  if (!dmsDisplay.active) {
+    return;
+  }
+  unsigned long now = millis();
+  if (now - dmsDisplay.stepStart < dmsDisplay.period) {
+    return;
+  }
+  /* if the loop fell behind, carry on from now rather than rushing through the missed steps */
+  dmsDisplay.stepStart = now;
+  dmsDisplay.step = (dmsDisplay.step + 1) % dmsDisplay.images;
+  dmsDisplayShift(dmsDisplay.image[dmsDisplay.step]);
+}
+
+/*
+ * SHIFT_OUT
+ *
+ * data: latch pin, data pin, clock pin, register count, then the image of the chain, least significant 7 bits first. the image is
+ * shifted out and latched straight away. a chain that is being scanned from a DISPLAY_FRAME stops being scanned, so the two don't
+ * fight over it
+ */
+void dmsShiftOut(byte argc, byte *argv) {
+  if (argc < 4 || argv[3] == 0 || argv[3] > DMS_MAX_FRAME_REGISTERS) {
+    return;
+  }
+  byte bits = argv[3] * 8;
+  byte size = (bits + 6) / 7;
+  if (argc < 4 + size) {
+    return;
+  }
+  unsigned long image = 0;
+  for (byte j = 0; j < size; j++) {
+    image |= (unsigned long)argv[4 + j] << (7 * j);
+  }
+  if (dmsDisplay.active && dmsDisplay.latchPin == argv[0]) {
+    dmsDisplay.active = false;
+  }
+  dmsShiftImage(argv[0], argv[1], argv[2], bits, image);
+}
+
+void dmsUpdate() {
+  dmsBuzzerUpdate();
+  dmsDisplayUpdate();
+}
+
+#endif
@@ -0,0 +1,141 @@
+from board_proxy import CoalescingBoard
+from metrics import MeteredBoard
+from state_store import StateStore
+import metrics
+from switch import DeadMansSwitch, SwitchConfig, open_board
+import json
+import sys
+import threading
+import time
+
+def connect(config, store = None):
+    """
+    Connects to the board of a switch, using its serial port (or the one saved in store) and instance id, and wraps it in a coalescing
+    proxy whose writes are counted, labelled with the name of the switch
+    """
+    board = CoalescingBoard(open_board(config, store))
+    with metrics.labels(switch=config.name):
+        return MeteredBoard(board)
+
+class SwitchFleet:
+    """
+    This class runs several dead mans switches, each with its own board, from one process
+
+    Every switch is supervised by its own thread (and its display by its own refresher thread), so a slow or stalled serial link only
+    holds up the switch on that link. If a switch fails, for example because its board is unplugged, the error is recorded in its
+    status and it is reconnected after retry_delay seconds. A switch with a state_file carries on from its saved state when it is
+    reconnected, rather than starting its countdown again
+
+    - configs represents a list of SwitchConfig, one for every switch, each with a unique name
+    - connect represents a function that is given a SwitchConfig and its StateStore (or None) and returns its board
+    """
+    def __init__(self, configs, connect = connect, retry_delay = 5) -> None:
+        names = [config.name for config in configs]
+        assert len(set(names)) == len(names), "every switch in a fleet must have a unique name"
+
+        self.configs = {config.name: config for config in configs}
+        self.connect = connect
+        self.retry_delay = retry_delay
+
+        #the running switch, supervisor thread and last error of every switch, by name
+        self.switches = {}
+        self.threads = {}
+        self.errors = {}
+
+        self.stop_event = threading.Event()
+        self.lock = threading.Lock()
+
+    def start(self):
+        """
+        Starts a supervisor thread for every switch
+        """
+        self.stop_event.clear()
+        for name, config in self.configs.items():
+            thread = threading.Thread(target=self.supervise, args=(config,), name=f"switch-{name}", daemon=True)
+            self.threads[name] = thread
+            thread.start()
+
+    def supervise(self, config):
+        """
+        Body of the supervisor thread of one switch. Connects to its board and runs it, reconnecting if anything fails, until the switch
+        finishes or the fleet is stopped
+        """
+        store = StateStore(config.state_file) if config.state_file is not None else None
+        try:
+            while not self.stop_event.is_set():
+                board = None
+                try:
+                    board = self.connect(config, store)
+                    switch = DeadMansSwitch(board, config, store)
+                    with self.lock:
+                        self.switches[config.name] = switch
+                        self.errors.pop(config.name, None)
+                    #the fleet may have been stopped while connecting
+                    if self.stop_event.is_set():
+                        switch.stop()
+                    switch.run()
+                    return
+                except Exception as error:
+                    with self.lock:
+                        self.errors[config.name] = f"{type(error).__name__}: {error}"
+                    self.stop_event.wait(self.retry_delay)
+                finally:
+                    if board is not None:
+                        try:
+                            board.shutdown()
+                        except Exception:
+                            pass
+        finally:
+            if store is not None:
+                store.close()
+
+    def stop(self, timeout = None):
+        """
+        Stops every switch and waits for the supervisor threads to finish
+        """
+        self.stop_event.set()
+        with self.lock:
+            switches = list(self.switches.values())
+        for switch in switches:
+            switch.stop()
+        for thread in self.threads.values():
+            thread.join(timeout)
+
+    def wait(self, timeout = None):
+        """
+        Waits until every switch has finished
+        """
+        for thread in self.threads.values():
+            thread.join(timeout)
+
+    def status(self):
+        """
+        OUTPUT:
+        - a dictionary of the status of every switch by name, including the last error if it failed, and whether it is still running
+        """
+        status = {}
+        with self.lock:
+            for name in self.configs:
+                switch = self.switches.get(name)
+                entry = switch.status() if switch is not None else {"name": name, "state": "connecting"}
+                entry["running"] = name in self.threads and self.threads[name].is_alive()
+                if name in self.errors:
+                    entry["error"] = self.errors[name]
+                status[name] = entry
+        return status
+
+if __name__ == "__main__":
+    """
+    Runs every switch described in a JSON file, a list of objects whose keys are the parameters of SwitchConfig, and prints the status of
+    the fleet every few seconds
+    """
+    with open(sys.argv[1]) as file:
+        configs = [SwitchConfig(**entry) for entry in json.load(file)]
+    fleet = SwitchFleet(configs)
+    fleet.start()
+    try:
+        while any(thread.is_alive() for thread in fleet.threads.values()):
+            print(json.dumps(fleet.status()))
+            time.sleep(5)
+    except KeyboardInterrupt:
+        fleet.stop()
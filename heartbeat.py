@@ -0,0 +1,273 @@
+import argparse
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import metrics
+import threading
+import time
+
+#default port heartbeats are listened for on, the same number is used for UDP and HTTP
+HEARTBEAT_PORT = 8766
+
+#longest a heartbeat request line and headers may be, anything longer is dropped
+MAX_REQUEST_BYTES = 4096
+
+class RateLimiter:
+    """
+    This class limits how many heartbeats every source may send, with a token bucket per source: a source may send burst heartbeats
+    at once, and then rate heartbeats per second
+
+    A source that has been quiet for long enough to fill its bucket again is the same as a new one, so such sources are forgotten once
+    more than max_sources are known. If every known source is still busy, heartbeats from new sources are refused instead
+    """
+    def __init__(self, rate = 10, burst = 20, max_sources = 1024) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.max_sources = max_sources
+        #tokens left and when they were last worked out, by source
+        self.buckets = {}
+
+    def allow(self, source, now = None):
+        """
+        OUTPUT:
+        - whether a heartbeat from source is allowed, taking a token from its bucket if it is
+        """
+        if now is None:
+            now = time.monotonic()
+        bucket = self.buckets.get(source)
+        if bucket is None:
+            if len(self.buckets) >= self.max_sources:
+                self.forget(now)
+                if len(self.buckets) >= self.max_sources:
+                    return False
+            bucket = self.buckets[source] = [self.burst, now]
+        tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+        bucket[1] = now
+        if tokens < 1:
+            bucket[0] = tokens
+            return False
+        bucket[0] = tokens - 1
+        return True
+
+    def forget(self, now):
+        #a bucket that would be full by now holds nothing worth keeping
+        full = self.burst / self.rate
+        self.buckets = {source: bucket for source, bucket in self.buckets.items() if now - bucket[1] < full}
+
+class HeartbeatListener:
+    """
+    This class listens on localhost for heartbeats from other services, over UDP and HTTP, and turns them into resets of a switch's
+    counter, the same as pressing its button
+
+    Every datagram sent to the UDP port is a heartbeat, and so is any GET or POST to /heartbeat on the HTTP port, which is answered with
+    204, or 429 if the source is over its limit. The source is the sender's address, and the name of the service if it gives one, as
+    the datagram's text or as /heartbeat/<name>
+
+    Heartbeats are rate limited per source and then coalesced: the first heartbeat after a quiet interval resets the counter straight
+    away, and any that follow within interval seconds of a reset are folded into a single reset at the end of the interval. So however
+    many heartbeats arrive, the counter is reset, and the display updated, at most once per interval
+
+    - on_beat represents the callable doing the reset, it is run on a single worker thread so a slow display never holds up the
+      listener, and only one reset is ever in flight
+    - host and port represent where to listen, port being used for both UDP and HTTP, 0 picks a free one
+    """
+    def __init__(self, on_beat, host = "127.0.0.1", port = HEARTBEAT_PORT, interval = 1.0, rate = 10, burst = 20) -> None:
+        self.on_beat = on_beat
+        self.host = host
+        self.port = port
+        self.interval = interval
+        self.limiter = RateLimiter(rate, burst)
+
+        #when the last reset was started, and whether a reset is waiting for the end of the interval
+        self.lastBeat = -float("inf")
+        self.flushPending = False
+
+        #the loop, its thread and servers once started
+        self.loop = None
+        self.thread = None
+        self.transport = None
+        self.server = None
+        self.ready = threading.Event()
+        #error raised while starting to listen on the thread made by start()
+        self.error = None
+        #resets run here one at a time, a reset can take as long as an interval waiting for its scan
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="heartbeat-reset")
+
+        #heartbeat metrics, see metrics.py
+        self.udpMetric = metrics.counter("heartbeats_received", transport="udp")
+        self.httpMetric = metrics.counter("heartbeats_received", transport="http")
+        self.limitedMetric = metrics.counter("heartbeats_limited")
+        self.coalescedMetric = metrics.counter("heartbeats_coalesced")
+        self.resetMetric = metrics.counter("heartbeat_resets")
+        self.resetTime = metrics.histogram("heartbeat_reset_seconds")
+
+    def beat(self, source):
+        """
+        Handles one heartbeat on the event loop
+
+        OUTPUT:
+        - whether the heartbeat was within its source's limit
+        """
+        now = time.monotonic()
+        if not self.limiter.allow(source, now):
+            self.limitedMetric.inc()
+            return False
+        if self.flushPending:
+            self.coalescedMetric.inc()
+        elif now - self.lastBeat >= self.interval:
+            self.reset(now)
+        else:
+            self.coalescedMetric.inc()
+            self.flushPending = True
+            self.loop.call_later(self.lastBeat + self.interval - now, self.flush)
+        return True
+
+    def flush(self):
+        self.flushPending = False
+        self.reset(time.monotonic())
+
+    def reset(self, now):
+        self.lastBeat = now
+        self.resetMetric.inc()
+        self.loop.run_in_executor(self.executor, self.run_beat)
+
+    def run_beat(self):
+        with self.resetTime.time():
+            self.on_beat()
+
+    def datagram_received(self, data, address):
+        self.udpMetric.inc()
+        self.beat((address[0], data[:64].decode(errors="replace").strip()))
+
+    async def handle_http(self, reader, writer):
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), 5)
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            writer.close()
+            return
+        self.httpMetric.inc()
+        parts = head.split(b"\r\n", 1)[0].decode(errors="replace").split()
+        if len(parts) < 2 or parts[0] not in ("GET", "POST") or not (parts[1] + "/").startswith("/heartbeat/"):
+            status = "404 Not Found"
+        else:
+            name = parts[1][len("/heartbeat/"):]
+            status = "204 No Content" if self.beat((writer.get_extra_info("peername")[0], name)) else "429 Too Many Requests"
+        writer.write(f"HTTP/1.1 {status}\r\nContent-Length: 0\r\nConnection: close\r\n\r\n".encode())
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+        writer.close()
+
+    async def serve(self):
+        """
+        Starts listening on the running loop
+
+        OUTPUT:
+        - the port being listened on, useful when port is 0
+        """
+        self.loop = asyncio.get_running_loop()
+        self.server = await asyncio.start_server(self.handle_http, self.host, self.port, limit=MAX_REQUEST_BYTES)
+        self.port = self.server.sockets[0].getsockname()[1]
+        listener = self
+
+        class Protocol(asyncio.DatagramProtocol):
+            def datagram_received(self, data, address):
+                listener.datagram_received(data, address)
+
+        try:
+            self.transport, _ = await self.loop.create_datagram_endpoint(Protocol, local_addr=(self.host, self.port))
+        except Exception:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+            raise
+        return self.port
+
+    def start(self):
+        """
+        Starts listening on an event loop of its own, on a daemon thread
+
+        OUTPUT:
+        - the port being listened on, the error is raised here if the port couldn't be listened on
+        """
+        def run():
+            loop = asyncio.new_event_loop()
+            try:
+                loop.run_until_complete(self.serve())
+            except Exception as error:
+                self.error = error
+                loop.close()
+                return
+            finally:
+                self.ready.set()
+            loop.run_forever()
+            loop.close()
+
+        self.error = None
+        self.thread = threading.Thread(target=run, name="heartbeat", daemon=True)
+        self.thread.start()
+        self.ready.wait()
+        if self.error is not None:
+            self.thread.join()
+            self.thread = None
+            self.loop = None
+            raise self.error
+        return self.port
+
+    def close(self):
+        """
+        Stops listening, and stops the loop if start() made it
+        """
+        def shutdown():
+            if self.transport is not None:
+                self.transport.close()
+            if self.server is not None:
+                self.server.close()
+            if self.thread is not None:
+                self.loop.stop()
+
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(shutdown)
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        self.executor.shutdown(wait=False)
+
+async def generate_load(port, rate, seconds, sources = 1, host = "127.0.0.1"):
+    """
+    Sends UDP heartbeats to a listener, spread evenly over the given sources, at rate heartbeats per second for seconds
+
+    OUTPUT:
+    - the number of heartbeats sent
+    """
+    loop = asyncio.get_running_loop()
+    transport, _ = await loop.create_datagram_endpoint(asyncio.DatagramProtocol, remote_addr=(host, port))
+    names = [f"load-{index}".encode() for index in range(sources)]
+    sent = 0
+    start = time.monotonic()
+    try:
+        while time.monotonic() - start < seconds:
+            #catch up on every heartbeat that is due, then give the loop a moment
+            due = int((time.monotonic() - start) * rate)
+            while sent < due:
+                transport.sendto(names[sent % sources])
+                sent += 1
+            await asyncio.sleep(0.001)
+    finally:
+        transport.close()
+    return sent
+
+if __name__ == "__main__":
+    """
+    Sends heartbeats to a listener on localhost, e.g. python heartbeat.py --rate 5000 --sources 50, and prints how many were sent. The
+    listener's metrics show how many were limited, coalesced and turned into resets
+    """
+    parser = argparse.ArgumentParser(description="sends UDP heartbeats to a dead mans switch on localhost")
+    parser.add_argument("--port", type=int, default=HEARTBEAT_PORT)
+    parser.add_argument("--rate", type=float, default=1000, help="heartbeats per second")
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--sources", type=int, default=1, help="number of services the heartbeats are spread over")
+    args = parser.parse_args()
+
+    sent = asyncio.run(generate_load(args.port, args.rate, args.seconds, args.sources))
+    print(f"sent {sent} heartbeats in {args.seconds} seconds")
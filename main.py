@@ -1,54 +1,51 @@
-from pymata4 import pymata4
-from bitShift import BitShift
-from anode_eight_segment import Segment_Display
-from buzzer import Buzzer
-from button import Button
-from counter import Counter
-import time
-
-
-ENABLE_OUTPUT = 4
-DATA_PIN = 7
-CLOCK_PIN = 2
-BUZZER = 3
-
-DEADMANS_SWITCH_DURATION = 99
-
-def count_one_second(seg,counter):
-    time_start = time.time()
-    while time.time() - time_start <= 1:
-        seg.print_word(str(counter.count))
-        time.sleep(0.01)
-        seg.reset_display()
-        time.sleep(0.01)
+from board_proxy import CoalescingBoard
+from metrics import MeteredBoard
+from state_store import StateStore
+from switch import DeadMansSwitch, SwitchConfig, open_board
+from tracing import TracingBoard
+import json
+import metrics
+import os
+import sys
+
+#local port the metrics are served on as JSON, and the file they are written to once the switch has finished
+METRICS_PORT = 8765
+METRICS_FILE = "metrics.json"
+
+#file the switch's state is kept in, so a restarted switch carries on counting down from where it was
+STATE_FILE = "switch_state.bin"
+
+#if set, every message sent over the link is traced to this file, summarise it with python tracing.py <file>
+TRACE_FILE = os.environ.get("DMS_TRACE")
 
 if __name__ == "__main__":
-    #initialise the arduinoUno class
-    board = pymata4.Pymata4()
-    #intialise the bitshift registers
-    bitshift = BitShift(board,ENABLE_OUTPUT,DATA_PIN,CLOCK_PIN,2)
-
-    #initialise the segment display
-    seg = Segment_Display(bitshift,[0,3,4,11],[1,5,9,7,6,2,10,8])
-
-    counter = Counter(DEADMANS_SWITCH_DURATION)
-
-    button = Button(board,counter,14)
-    buzzer = Buzzer(board, BUZZER)
-
-
-    buzzer.ramp_up()
-
-    start = time.time()
-    while counter.count != 0:
-        count_one_second(seg,counter)
-        counter.decrement()
-
-    seg.rolling_sentence("Alarm")
-    for i in range(10):
-        buzzer.ramp_up()
-        time.sleep(1)
-        
-
-    
-
+    #the port, baud rate and instance id can be given in a JSON file of SwitchConfig parameters, so the board isn't searched for
+    settings = {}
+    if len(sys.argv) > 1:
+        with open(sys.argv[1]) as file:
+            settings = json.load(file)
+    settings.setdefault("state_file", STATE_FILE)
+    config = SwitchConfig(**settings)
+    store = StateStore(config.state_file) if config.state_file is not None else None
+
+    #initialise the arduinoUno class on the port it was last found on if there is one, every write goes through the coalescing proxy
+    #and is counted on the way
+    board = open_board(config, store)
+    if TRACE_FILE:
+        board = TracingBoard(board, TRACE_FILE)
+    with metrics.labels(switch=config.name):
+        board = MeteredBoard(CoalescingBoard(board))
+    #the metrics are optional, so a port that is already taken doesn't stop the switch from running
+    try:
+        metrics.registry.serve(METRICS_PORT)
+    except OSError as error:
+        print(f"not serving metrics on port {METRICS_PORT}: {error}")
+
+    #wire up the bitshift, display, counter, button and buzzer, and run the switch until the alarm has finished
+    switch = DeadMansSwitch(board, config, store)
+    try:
+        switch.run()
+    finally:
+        metrics.registry.dump(METRICS_FILE)
+        if TRACE_FILE:
+            board.close()
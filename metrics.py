@@ -0,0 +1,299 @@
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from firmata_commands import encode_pin_writes
+import bisect
+import json
+import math
+import threading
+import time
+
+#default histogram buckets, upper bounds in seconds from 10us to 10s
+TIME_BUCKETS = (1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+#labels added to every metric looked up on each thread, see labels()
+local = threading.local()
+
+@contextmanager
+def labels(**extra):
+    """
+    Context manager adding extra labels to every metric looked up on this thread inside its block, e.g. the name of the switch the
+    components being created belong to, so the metrics of several switches in one process are kept apart
+
+    Components look their metrics up when they are created, so creating them inside the block is enough even if they are used from
+    other threads later
+    """
+    previous = current_labels()
+    local.labels = {**previous, **extra}
+    try:
+        yield
+    finally:
+        local.labels = previous
+
+def current_labels():
+    """
+    OUTPUT:
+    - the labels added by labels() on this thread
+    """
+    return getattr(local, "labels", {})
+
+class MetricCounter:
+    """
+    This class counts how many times something happened. Its rate is worked out against the time the registry was started
+    """
+    def __init__(self) -> None:
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount = 1):
+        with self.lock:
+            self.value += amount
+
+    def snapshot(self, uptime):
+        return {"value": self.value, "rate_per_second": self.value / uptime if uptime > 0 else 0.0}
+
+class Gauge:
+    """
+    This class holds the last value set, like the drift of the countdown
+    """
+    def __init__(self) -> None:
+        self.value = None
+
+    def set(self, value):
+        self.value = value
+
+    def snapshot(self, uptime):
+        return {"value": self.value}
+
+class Histogram:
+    """
+    This class records a distribution of values (usually durations in seconds) into fixed buckets, keeping the count, sum, sum of
+    squares, minimum and maximum so the mean and standard deviation (the jitter, for an interval) can be reported without storing
+    every value
+
+    - buckets represents the upper bound of every bucket in increasing order, values above the last one go in an overflow bucket
+    """
+    def __init__(self, buckets = TIME_BUCKETS) -> None:
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.squares = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        with self.lock:
+            self.counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.count += 1
+            self.sum += value
+            self.squares += value * value
+            if value < self.min:
+                self.min = value
+            if value > self.max:
+                self.max = value
+
+    def time(self):
+        """
+        OUTPUT:
+        - a context manager that observes how many seconds its block took
+        """
+        return Timer(self)
+
+    def quantile(self, q):
+        """
+        OUTPUT:
+        - the upper bound of the bucket holding the q quantile, or the maximum if it is in the overflow bucket, None if nothing was observed
+        """
+        if self.count == 0:
+            return None
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= target:
+                return min(bound, self.max)
+        return self.max
+
+    def snapshot(self, uptime):
+        with self.lock:
+            if self.count == 0:
+                return {"count": 0}
+            mean = self.sum / self.count
+            return {
+                "count": self.count,
+                "rate_per_second": self.count / uptime if uptime > 0 else 0.0,
+                "mean": mean,
+                "stddev": math.sqrt(max(0.0, self.squares / self.count - mean * mean)),
+                "min": self.min,
+                "max": self.max,
+                "p50": self.quantile(0.5),
+                "p99": self.quantile(0.99),
+                "buckets": {str(bound): count for bound, count in zip(self.buckets + ("inf",), self.counts) if count},
+            }
+
+class Timer:
+    """
+    Context manager returned by Histogram.time()
+    """
+    def __init__(self, histogram) -> None:
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start)
+
+class Registry:
+    """
+    This class holds every metric of the process by name. Asking for a metric that already exists returns it, so components can look
+    their metrics up once when they are created and then only pay for updating them
+
+    Labels are given as keyword arguments and become part of the name, e.g. counter("board_writes", pin=3) is "board_writes{pin=3}",
+    along with any added by labels() on the calling thread
+    """
+    def __init__(self) -> None:
+        self.metrics = {}
+        self.started = time.monotonic()
+        self.lock = threading.Lock()
+        self.server = None
+
+    def get(self, kind, name, labels):
+        labels = {**current_labels(), **labels}
+        if labels:
+            name += "{" + ",".join(f"{key}={value}" for key, value in sorted(labels.items())) + "}"
+        metric = self.metrics.get(name)
+        if metric is None:
+            with self.lock:
+                metric = self.metrics.setdefault(name, kind())
+        assert isinstance(metric, kind), f"metric {name} already exists as a {type(metric).__name__}"
+        return metric
+
+    def counter(self, name, **labels):
+        return self.get(MetricCounter, name, labels)
+
+    def gauge(self, name, **labels):
+        return self.get(Gauge, name, labels)
+
+    def histogram(self, name, **labels):
+        return self.get(Histogram, name, labels)
+
+    def snapshot(self):
+        """
+        OUTPUT:
+        - a dictionary of every metric's current values by name, and how long the registry has been running
+        """
+        uptime = time.monotonic() - self.started
+        with self.lock:
+            metrics = dict(self.metrics)
+        return {
+            "time": time.time(),
+            "uptime_seconds": uptime,
+            "metrics": {name: metric.snapshot(uptime) for name, metric in sorted(metrics.items())},
+        }
+
+    def dump(self, path):
+        """
+        Writes a snapshot to path as JSON
+        """
+        with open(path, "w") as file:
+            json.dump(self.snapshot(), file, indent=2)
+
+    def serve(self, port = 8765, host = "127.0.0.1"):
+        """
+        Starts a small HTTP server on a daemon thread, answering every GET with a snapshot as JSON. Only localhost is listened on unless
+        host says otherwise
+
+        OUTPUT:
+        - the port being listened on, useful when port is 0
+        """
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = json.dumps(registry.snapshot()).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self.server.server_address[1]
+
+    def stop_serving(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+#the registry used by every component unless they are given another
+registry = Registry()
+
+def counter(name, **labels):
+    return registry.counter(name, **labels)
+
+def gauge(name, **labels):
+    return registry.gauge(name, **labels)
+
+def histogram(name, **labels):
+    return registry.histogram(name, **labels)
+
+class MeteredBoard:
+    """
+    This class wraps an instantiated pymata4 board (or a CoalescingBoard) and has the same interface, counting the digital writes asked
+    of it for every pin, and the transfers and bytes of raw commands it passes on
+
+    Wrapping the coalescing proxy counts the writes the components make, wrapping the pymata4 board underneath it counts what is left
+    after coalescing
+
+    The pin counters are created on whichever thread writes first, so the labels() in force when this object is created are kept and
+    given to them
+    """
+    def __init__(self, board, registry = registry) -> None:
+        self.board = board
+        self.registry = registry
+        self.labels = current_labels()
+        #counters for every pin, created the first time the pin is written
+        self.pinWrites = {}
+        self.transfers = registry.counter("board_transfers")
+        self.bytesSent = registry.counter("board_bytes")
+        self.sysexSent = registry.counter("board_sysex")
+
+    def __getattr__(self, name):
+        #pin modes, frames, callbacks and shutdown go straight to the board
+        return getattr(self.board, name)
+
+    def count_write(self, pin):
+        writes = self.pinWrites.get(pin)
+        if writes is None:
+            writes = self.pinWrites[pin] = self.registry.counter("board_writes", pin=pin, **self.labels)
+        writes.inc()
+
+    def digital_pin_write(self, pin, value):
+        self.count_write(pin)
+        self.board.digital_pin_write(pin, value)
+
+    def digital_pin_write_many(self, writes):
+        writes = list(writes)
+        for pin, _ in writes:
+            self.count_write(pin)
+        if hasattr(self.board, "digital_pin_write_many"):
+            self.board.digital_pin_write_many(writes)
+        else:
+            self._send_command(encode_pin_writes(writes))
+
+    def _send_command(self, command):
+        self.transfers.inc()
+        self.bytesSent.inc(len(command))
+        return self.board._send_command(command)
+
+    def _send_sysex(self, sysex_command, sysex_data = None):
+        self.sysexSent.inc()
+        return self.board._send_sysex(sysex_command, sysex_data)
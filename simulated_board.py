@@ -0,0 +1,220 @@
+from collections import Counter
+from firmata_commands import SET_DIGITAL_PIN_VALUE, DIGITAL_MESSAGE, SET_PIN_MODE, START_SYSEX, END_SYSEX, INPUT, OUTPUT, PULLUP, \
+    DISPLAY_FRAME, SHIFT_OUT, decode_display_frame, decode_shift_out
+import threading
+import time
+
+class SimulatedBoard:
+    """
+    This class stands in for an instantiated pymata4 board, so BitShift, Segment_Display, Buzzer and Button can be run without an
+    ArduinoUno attached
+
+    Every command is encoded into the bytes pymata4 would send, and the time those bytes take on the serial link is modelled from
+    baud_rate (10 bits per byte) plus a fixed latency per transfer. The link can only carry one transfer at a time. If realtime is
+    True, each call blocks until its transfer would have finished, like a real serial write on a saturated link, otherwise the time is
+    only added up in linkBusyTime
+
+    - messages counts the messages that wrote to every pin (a port message counts once for each pin whose level it changes)
+    - pinMessages and portMessages count the single pin writes for every pin, and the whole port writes for every port
+    - sysexMessages counts the sysex messages sent for every sysex command
+    - inject() changes the level of an input pin and calls its callback, like a button being pressed
+    - if record is True, every change of an output pin's level is kept in events as (time, pin, level)
+    - a DISPLAY_FRAME upload is scanned the way the firmware extension would, scanned_image() gives the image latched at any time
+    - a SHIFT_OUT is latched straight away, stopping any scanning, and the pins of the chain are left where the firmware leaves them
+    """
+    def __init__(self, baud_rate = 115200, latency = 0.0, realtime = False, record = False) -> None:
+        self.baud_rate = baud_rate
+        self.latency = latency
+        self.realtime = realtime
+        self.record = record
+
+        #the mode and level of every pin, and the callbacks of input pins
+        self.modes = {}
+        self.levels = {}
+        self.callbacks = {}
+
+        #counters used to measure the traffic sent to the board
+        self.messages = Counter()
+        self.pinMessages = Counter()
+        self.portMessages = Counter()
+        self.sysexMessages = Counter()
+        self.bytesSent = 0
+        self.transfers = 0
+        self.linkBusyTime = 0.0
+
+        #every sysex message received, as (command, data)
+        self.sysex = []
+
+        #the last display frame uploaded, as (time it was received, images, period in seconds), None until the first one
+        self.displayFrame = None
+        self.events = []
+
+        #the link carries one transfer at a time, linkFreeAt is when the current one finishes
+        self.linkFreeAt = 0.0
+        self.lock = threading.Lock()
+
+    ######################################################################
+    # pymata4 interface
+    ######################################################################
+    def set_pin_mode_digital_output(self, pin_number):
+        self._send_command((SET_PIN_MODE, pin_number, OUTPUT))
+
+    def set_pin_mode_digital_input(self, pin_number, callback = None):
+        self.callbacks[pin_number] = callback
+        self._send_command((SET_PIN_MODE, pin_number, INPUT))
+
+    def set_pin_mode_digital_input_pullup(self, pin_number, callback = None):
+        self.callbacks[pin_number] = callback
+        self._send_command((SET_PIN_MODE, pin_number, PULLUP))
+
+    def digital_pin_write(self, pin, value):
+        self._send_command((SET_DIGITAL_PIN_VALUE, pin, value))
+
+    def digital_read(self, pin):
+        return [self.levels.get(pin, 0), time.time()]
+
+    def _send_sysex(self, sysex_command, sysex_data = None):
+        self._send_command([START_SYSEX, sysex_command] + list(sysex_data or []) + [END_SYSEX])
+
+    def _send_command(self, command):
+        """
+        Receives the raw bytes of one transfer, applies every command in it and models the time it takes on the link
+
+        OUTPUT:
+        - the number of bytes sent, like a serial write
+        """
+        message = bytes(command)
+        with self.lock:
+            self.transfers += 1
+            self.bytesSent += len(message)
+            duration = len(message) * 10 / self.baud_rate + self.latency
+            self.linkBusyTime += duration
+            now = time.monotonic()
+            self.linkFreeAt = max(now, self.linkFreeAt) + duration
+            finished = self.linkFreeAt
+            self.apply(message)
+        if self.realtime:
+            delay = finished - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        return len(message)
+
+    def shutdown(self):
+        pass
+
+    ######################################################################
+    # simulation
+    ######################################################################
+    def apply(self, message):
+        """
+        Decodes the bytes of a transfer and applies every command in it to the simulated pins
+        """
+        i = 0
+        while i < len(message):
+            command = message[i]
+            if command == START_SYSEX:
+                end = message.index(END_SYSEX, i)
+                self.receive_sysex(message[i + 1], list(message[i + 2:end]))
+                i = end + 1
+            elif command == SET_DIGITAL_PIN_VALUE:
+                pin, value = message[i + 1], message[i + 2]
+                self.messages[pin] += 1
+                self.pinMessages[pin] += 1
+                self.set_level(pin, value)
+                i += 3
+            elif command & 0xF0 == DIGITAL_MESSAGE:
+                port = command & 0x0F
+                bits = message[i + 1] | (message[i + 2] << 7)
+                self.portMessages[port] += 1
+                for pin in range(port * 8, port * 8 + 8):
+                    #only output pins are written by a port message
+                    if self.modes.get(pin) == OUTPUT and self.levels.get(pin, 0) != (bits >> (pin - port * 8)) & 1:
+                        self.messages[pin] += 1
+                        self.set_level(pin, (bits >> (pin - port * 8)) & 1)
+                i += 3
+            elif command == SET_PIN_MODE:
+                self.modes[message[i + 1]] = message[i + 2]
+                i += 3
+            else:
+                raise ValueError(f"simulated board received unknown command {command:#x}")
+
+    def receive_sysex(self, command, data):
+        """
+        Handles a sysex message, this is where the firmware extensions are simulated
+        """
+        self.sysexMessages[command] += 1
+        self.sysex.append((command, data))
+        if command == DISPLAY_FRAME:
+            _, _, _, _, images, period = decode_display_frame(data)
+            self.displayFrame = (time.monotonic(), images, period / 1000)
+        elif command == SHIFT_OUT:
+            latch_pin, data_pin, clock_pin, _, image = decode_shift_out(data)
+            #a single image is held, the same as a frame of one image
+            self.displayFrame = (time.monotonic(), [image], 0)
+            self.set_level(data_pin, image & 1)
+            self.set_level(clock_pin, 0)
+            self.set_level(latch_pin, 1)
+
+    def scanned_image(self, at = None):
+        """
+        OUTPUT:
+        - the image the board would have latched into its bitshift chain at the monotonic time at (now unless given) while scanning the
+          last display frame, None if no frame has been uploaded
+        """
+        if self.displayFrame is None:
+            return None
+        received, images, period = self.displayFrame
+        if at is None:
+            at = time.monotonic()
+        if len(images) == 1 or period == 0:
+            return images[0]
+        return images[int((at - received) / period) % len(images)]
+
+    def set_level(self, pin, value):
+        if self.record and self.levels.get(pin, 0) != value:
+            self.events.append((time.monotonic(), pin, value))
+        self.levels[pin] = value
+
+    def inject(self, pin, value):
+        """
+        Sets the level of an input pin and calls its callback if the level changed, with the same data pymata4 would give
+        [pin_type, pin_number, pin_value, raw_time_stamp]
+
+        The callback runs on the calling thread, which plays the part of pymata4's reporter thread
+        """
+        if self.levels.get(pin, 0) == value:
+            return
+        self.levels[pin] = value
+        callback = self.callbacks.get(pin)
+        if callback is not None:
+            callback([self.modes.get(pin, INPUT), pin, value, time.time()])
+
+    def press(self, pin, hold = 0.1):
+        """
+        Simulates a button on pin being pressed for hold seconds and then released
+        """
+        self.inject(pin, 1)
+        time.sleep(hold)
+        self.inject(pin, 0)
+
+    def reset_counters(self):
+        """
+        Clears every traffic counter, leaving the pin levels as they are
+        """
+        with self.lock:
+            self.messages = Counter()
+            self.pinMessages = Counter()
+            self.portMessages = Counter()
+            self.sysexMessages = Counter()
+            self.bytesSent = 0
+            self.transfers = 0
+            self.linkBusyTime = 0.0
+            self.sysex = []
+            self.events = []
+
+    def message_count(self):
+        """
+        OUTPUT:
+        - the total number of messages sent to the board, single pin writes, port writes and sysex
+        """
+        return sum(self.pinMessages.values()) + sum(self.portMessages.values()) + sum(self.sysexMessages.values())
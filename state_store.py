@@ -0,0 +1,166 @@
+import os
+import struct
+import threading
+import time
+import zlib
+
+#every record is a header, (kind, size, deadline, last reset, crc32), the crc covering the header before it and any bytes that follow
+RECORD = struct.Struct("<BBddI")
+HEADER = struct.Struct("<BBdd")
+
+#record kinds, a STATE record holds the wall clock deadline, the wall clock time of the last reset and the state, a PORT record is
+#followed by size bytes naming the serial port the board was last found on
+STATE = 1
+PORT = 2
+
+#states that can be saved, in the order of their codes
+STATES = ("ready", "counting", "alarm", "finished", "stopped")
+
+class SavedState:
+    """
+    The last state saved by a StateStore
+    """
+    def __init__(self, state, deadline, last_reset) -> None:
+        #state of the switch, one of STATES
+        self.state = state
+        #wall clock (time.time()) deadline of the counter, and when it was last reset
+        self.deadline = deadline
+        self.last_reset = last_reset
+
+    def remaining(self, now = None):
+        """
+        OUTPUT:
+        - the number of seconds that were left on the counter at the time now (time.time() unless given), 0 if it has run out
+        """
+        if now is None:
+            now = time.time()
+        return max(0.0, self.deadline - now)
+
+class StateStore:
+    """
+    This class keeps the state of a switch in an append-only file, so that a restarted process can carry on where the last one stopped
+
+    Every save appends one small record with a single unbuffered write, so a save costs one system call. Each record carries a crc, so
+    a record torn by a crash is detected when the file is opened, and it is cut off along with anything after it. Once the file holds
+    more than COMPACT_AFTER records, it is rewritten with only the latest state and port, replacing the old file in one rename
+
+    The deadline is saved on the wall clock, as the monotonic clock starts again when the host restarts
+
+    - path represents the file the state is kept in, it is created if it doesn't exist
+    - sync represents whether every save is flushed to disk with fsync, which survives the host losing power and not just the process
+      crashing, at the cost of a much slower save
+    """
+    COMPACT_AFTER = 1000
+
+    def __init__(self, path, sync = False) -> None:
+        self.path = path
+        self.sync = sync
+
+        #the latest state and port read from the file or saved since
+        self.saved = None
+        self.port = None
+        self.records = 0
+        #saves can come from the main loop and the button thread at once, the latest state is updated under the same lock as its
+        #record is appended, so a compaction always keeps the state of the last record
+        self.lock = threading.RLock()
+
+        self.load()
+        self.fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+    def load(self):
+        """
+        Reads every valid record of the file, keeping the latest state and port, and cuts off a torn record at the end
+        """
+        try:
+            with open(self.path, "rb") as file:
+                data = file.read()
+        except FileNotFoundError:
+            return
+
+        offset = 0
+        while offset + RECORD.size <= len(data):
+            kind, size, deadline, last_reset, crc = RECORD.unpack_from(data, offset)
+            end = offset + RECORD.size + (size if kind == PORT else 0)
+            if end > len(data):
+                break
+            body = data[offset:offset + HEADER.size] + data[offset + RECORD.size:end]
+            if zlib.crc32(body) != crc or kind not in (STATE, PORT):
+                break
+            if kind == STATE:
+                if size < len(STATES):
+                    self.saved = SavedState(STATES[size], deadline, last_reset)
+            else:
+                self.port = data[offset + RECORD.size:end].decode()
+            self.records += 1
+            offset = end
+
+        if offset < len(data):
+            #the rest was torn by a crash, cut it off so new records follow the last valid one
+            os.truncate(self.path, offset)
+
+    def encode(self, kind, size, deadline, last_reset, extra = b""):
+        header = HEADER.pack(kind, size, deadline, last_reset)
+        return header + struct.pack("<I", zlib.crc32(header + extra)) + extra
+
+    def write(self, record):
+        with self.lock:
+            os.write(self.fd, record)
+            if self.sync:
+                os.fsync(self.fd)
+            self.records += 1
+            if self.records > self.COMPACT_AFTER:
+                self.compact()
+
+    def save(self, state, deadline, last_reset):
+        """
+        INPUT:
+        - state representing the state of the switch, one of STATES
+        - deadline representing the wall clock time the counter runs out at
+        - last_reset representing the wall clock time the counter was last reset at
+
+        OUTPUT:
+        - the state is appended to the file
+        """
+        with self.lock:
+            self.saved = SavedState(state, deadline, last_reset)
+            self.write(self.encode(STATE, STATES.index(state), deadline, last_reset))
+
+    def save_port(self, port):
+        """
+        Remembers the serial port the board was found on, so the next connection doesn't have to search for it
+        """
+        name = port.encode()
+        assert len(name) < 256, "port name must be shorter than 256 bytes"
+        with self.lock:
+            if port == self.port:
+                return
+            self.port = port
+            self.write(self.encode(PORT, len(name), 0.0, time.time(), name))
+
+    def compact(self):
+        """
+        Rewrites the file with only the latest state and port
+        """
+        data = b""
+        if self.port is not None:
+            name = self.port.encode()
+            data += self.encode(PORT, len(name), 0.0, time.time(), name)
+        if self.saved is not None:
+            data += self.encode(STATE, STATES.index(self.saved.state), self.saved.deadline, self.saved.last_reset)
+
+        temporary = self.path + ".tmp"
+        with open(temporary, "wb") as file:
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary, self.path)
+
+        os.close(self.fd)
+        self.fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self.records = (self.port is not None) + (self.saved is not None)
+
+    def close(self):
+        with self.lock:
+            if self.fd is not None:
+                os.close(self.fd)
+                self.fd = None
@@ -0,0 +1,345 @@
+from bitShift import BitShift
+from eight_segment import Segment_Display
+from buzzer import Buzzer
+from button import Button
+from counter import Counter
+from heartbeat import HeartbeatListener
+import math
+import metrics
+import threading
+import time
+
+
+ENABLE_OUTPUT = 4
+DATA_PIN = 7
+CLOCK_PIN = 2
+BUZZER = 3
+BUTTON = 14
+
+#indexes of the bitshift outputs wired to the digit pins and to the segment pins of the display
+DIGIT_INDEXES = [0,3,4,11]
+SEGMENT_INDEXES = [1,5,9,7,6,2,10,8]
+
+DEADMANS_SWITCH_DURATION = 99
+DISPLAY_REFRESH_HZ = 50
+
+#longest a button press may take to be shown on the display, from pymata4 reporting the press to the end of the scan showing the new
+#count. A press can land just after a scan has started, so this allows for that scan and the one after it on a 57600 baud link
+RESET_LATENCY_TARGET = 0.25
+
+def show_count(seg,counter,stop_event = None,lateness = None):
+    #the display is multiplexed by its own refresher thread, so only the framebuffer needs updating
+    remaining = counter.remaining()
+    seg.set_text(str(math.ceil(remaining)))
+    #how long after the count changed it was shown, the count changes whenever remaining crosses a whole second
+    if lateness is None:
+        lateness = metrics.histogram("countdown_update_lateness_seconds")
+    lateness.observe(math.ceil(remaining) - remaining)
+    #sleep until the count changes, the counter works from a deadline so oversleeping here never causes drift
+    if stop_event is None:
+        time.sleep(counter.time_to_next_tick())
+    else:
+        stop_event.wait(counter.time_to_next_tick())
+
+class SwitchConfig:
+    """
+    This class holds the configuration of one dead mans switch: how to reach its board, how its components are wired, and its timings.
+    Every parameter defaults to the wiring used by main.py
+    """
+    def __init__(self, name = "switch", com_port = None, baud_rate = 115200, arduino_instance_id = 1, latch_pin = ENABLE_OUTPUT, data_pin = DATA_PIN,
+                 clock_pin = CLOCK_PIN, shift_register_count = 2, digit_indexes = DIGIT_INDEXES, segment_indexes = SEGMENT_INDEXES,
+                 common_anode = True, buzzer_pin = BUZZER, button_pin = BUTTON, duration = DEADMANS_SWITCH_DURATION,
+                 refresh_hz = DISPLAY_REFRESH_HZ, alarm_bursts = 10, state_file = None, arduino_wait = 4, reconnect_wait = 0.1,
+                 board_scan = False, board_shift = False, heartbeat_port = None, heartbeat_interval = 1.0, heartbeat_rate = 10) -> None:
+        self.name = name
+        #serial port, baud rate and FirmataExpress instance id of the board, a com_port of None letting pymata4 search for it
+        self.com_port = com_port
+        self.baud_rate = baud_rate
+        self.arduino_instance_id = arduino_instance_id
+        self.latch_pin = latch_pin
+        self.data_pin = data_pin
+        self.clock_pin = clock_pin
+        self.shift_register_count = shift_register_count
+        self.digit_indexes = list(digit_indexes)
+        self.segment_indexes = list(segment_indexes)
+        self.common_anode = common_anode
+        self.buzzer_pin = buzzer_pin
+        self.button_pin = button_pin
+        #number of seconds counted down from, and how often the display is refreshed
+        self.duration = duration
+        self.refresh_hz = refresh_hz
+        #how many ramp ups are sounded once the counter runs out
+        self.alarm_bursts = alarm_bursts
+        #file the state is kept in so a restarted switch carries on where it stopped, None to always start afresh
+        self.state_file = state_file
+        #seconds pymata4 waits for the board to reset after opening its port, and the shorter wait tried first on a known port
+        self.arduino_wait = arduino_wait
+        self.reconnect_wait = reconnect_wait
+        #whether the board scans the display by itself, which needs the DISPLAY_FRAME extension in firmware/
+        self.board_scan = board_scan
+        #whether the board shifts every image out by itself from one message, which needs the SHIFT_OUT extension in firmware/
+        self.board_shift = board_shift
+        #localhost port heartbeats from other services reset the counter on (UDP and HTTP, see heartbeat.py), None to only use the
+        #button, at most one reset is made per heartbeat_interval seconds, and every service may send heartbeat_rate per second
+        self.heartbeat_port = heartbeat_port
+        self.heartbeat_interval = heartbeat_interval
+        self.heartbeat_rate = heartbeat_rate
+
+def open_board(config, store = None):
+    """
+    Connects to the board of a switch
+
+    If the serial port is known, from the config or from the port saved in store, it is opened directly with a wait of only
+    reconnect_wait seconds, which is enough when the board keeps running across the reconnect (a board that resets when its port is
+    opened needs its auto reset disabled for this). If that fails the port is tried again with the full arduino_wait, and if that fails
+    too every port is searched as usual. The port the board was found on is saved to store
+
+    pymata4 is only imported here, so nothing that runs without a real board (the simulator, benchmarks) pays for importing it. It
+    still asks the board for its firmware version and analog map once connected, as it builds its pin tables from them
+
+    OUTPUT:
+    - an instantiated pymata4 board
+    """
+    from pymata4 import pymata4
+
+    port = config.com_port or (store.port if store is not None else None)
+    board = None
+    if port is not None:
+        for wait in (config.reconnect_wait, config.arduino_wait):
+            try:
+                board = pymata4.Pymata4(com_port=port, baud_rate=config.baud_rate, arduino_instance_id=config.arduino_instance_id,
+                                        arduino_wait=wait)
+                break
+            except Exception:
+                continue
+    if board is None:
+        board = pymata4.Pymata4(baud_rate=config.baud_rate, arduino_instance_id=config.arduino_instance_id, arduino_wait=config.arduino_wait)
+    if store is not None:
+        store.save_port(board.serial_port.port)
+    return board
+
+class DeadMansSwitch:
+    """
+    This class wires a bitshift, segment display, counter, button and buzzer to a board as described by a SwitchConfig, and runs the
+    switch: the counter is shown counting down, the button resets it, and once it runs out the alarm is sounded
+
+    A press is handled as a pipeline on the button's worker thread: the debounced press resets the counter's deadline, the new count
+    is put in the framebuffer, the refresher is woken to scan it straight away and a chirp confirms it. The time from the press being
+    reported to the new count having been scanned is kept in lastResetLatency and recorded in the metrics registry, it should stay under
+    RESET_LATENCY_TARGET
+
+    If store (a StateStore) is given, the deadline, last reset and state are saved whenever they change, and run() carries on from the
+    saved state: straight back to counting down the time that was left, or straight to the alarm if it ran out in the meantime
+
+    If the config has a heartbeat_port, heartbeats sent to it on localhost reset the counter through the same pipeline as a press, but
+    without the chirp, while run() is going
+
+    Every metric of the switch and its components is labelled with switch=<config.name>, so the switches of a fleet can be told apart
+
+    Most writes to the board are made by the display refresher and the buzzer player threads. If one of them fails, for example
+    because the board was unplugged, the switch stops and run() raises the error, so whoever runs it (like SwitchFleet) can reconnect
+
+    status() can be called from any thread while run() is going
+    """
+    def __init__(self, board, config = None, store = None) -> None:
+        if config is None:
+            config = SwitchConfig()
+        self.config = config
+        self.board = board
+
+        #every metric looked up from here on is labelled with the name of the switch
+        with metrics.labels(switch=config.name):
+            #intialise the bitshift registers
+            self.bitshift = BitShift(board,config.latch_pin,config.data_pin,config.clock_pin,config.shift_register_count,
+                                     board_shift=config.board_shift)
+            #initialise the segment display
+            self.seg = Segment_Display(self.bitshift,config.digit_indexes,config.segment_indexes,common_anode=config.common_anode)
+            self.counter = Counter(config.duration)
+            self.button = Button(board,self.counter,config.button_pin,on_reset=self.handle_reset)
+            self.buzzer = Buzzer(board,config.buzzer_pin)
+
+            self.resetLatency = metrics.histogram("reset_latency_seconds")
+            #how late every count was shown, and, as the counter runs on the monotonic clock, how far the wall clock has moved apart
+            #from it
+            self.lateness = metrics.histogram("countdown_update_lateness_seconds")
+            self.drift = metrics.gauge("countdown_drift_seconds")
+            self.ticks = metrics.counter("countdown_ticks")
+
+        #one of "ready", "counting", "alarm", "finished", "stopped" or "failed"
+        self.state = "ready"
+        #the first error raised on the refresher or player thread, raised again by run()
+        self.error = None
+        self.seg.refresher.on_error = self.fail
+        self.buzzer.on_error = self.fail
+        self.stop_event = threading.Event()
+        #set when the count loop should redraw straight away, because the counter was reset or the switch is stopping
+        self.wake_event = threading.Event()
+
+        #where the state is saved, and the wall clock time of the last reset
+        self.store = store
+        self.lastReset = None
+
+        #end to end latency of the last reset, None until the first one
+        self.lastResetLatency = None
+
+        #listener for heartbeats from other services, made by run() if the config has a heartbeat_port
+        self.heartbeats = None
+
+    def run(self):
+        """
+        Runs the switch until the alarm has finished, or stop() is called
+        """
+        if self.config.board_scan:
+            self.seg.start_board_refresh(self.config.refresh_hz)
+        else:
+            self.seg.start_refresh(self.config.refresh_hz)
+        try:
+            #a port that is already taken raises here, after the refresher has been stopped again by the finally below
+            if self.config.heartbeat_port is not None:
+                with metrics.labels(switch=self.config.name):
+                    self.heartbeats = HeartbeatListener(self.heartbeat, port=self.config.heartbeat_port,
+                                                        interval=self.config.heartbeat_interval, rate=self.config.heartbeat_rate,
+                                                        burst=2 * self.config.heartbeat_rate)
+                self.heartbeats.start()
+            resumed = self.resume()
+            if resumed is None:
+                #the ramp up plays in the background, so the first count is shown straight away
+                self.buzzer.ramp_up(block=False)
+                #the count starts from the full duration once the switch is running
+                self.counter.reset()
+                self.lastReset = time.time()
+
+            if resumed != "alarm":
+                self.state = "counting"
+                self.save()
+                wallStart, monotonicStart = time.time(), time.monotonic()
+                while self.counter.count != 0 and not self.stop_event.is_set():
+                    #cleared before the count is read, so a reset from here on wakes the wait in show_count
+                    self.wake_event.clear()
+                    show_count(self.seg,self.counter,self.wake_event,self.lateness)
+                    self.ticks.inc()
+                    self.drift.set((time.time() - wallStart) - (time.monotonic() - monotonicStart))
+                if self.stop_event.is_set():
+                    return
+
+            self.state = "alarm"
+            self.save()
+            #the refresher keeps scanning while the sentence scrolls
+            self.seg.rolling_sentence("Alarm")
+            self.seg.set_text("0")
+            #the alarm plays in the background, one ramp up every second, while the display keeps refreshing
+            self.buzzer.play(Buzzer.RAMP_UP_PATTERN + [(0, 1)], repeat=self.config.alarm_bursts)
+            while not self.buzzer.wait(0.1):
+                if self.stop_event.is_set():
+                    self.buzzer.cancel()
+                    return
+            self.state = "finished"
+            self.save()
+        finally:
+            if self.heartbeats is not None:
+                self.heartbeats.close()
+            #a new switch is built on every reconnect, so its threads are stopped here rather than left holding the old board
+            self.button.close()
+            self.buzzer.close()
+            if self.error is not None:
+                self.state = "failed"
+            elif self.stop_event.is_set():
+                self.state = "stopped"
+            try:
+                self.seg.stop_refresh()
+            except Exception:
+                #the link is already known to be down, the error that brought it down is the one worth raising
+                if self.error is None:
+                    raise
+            #raised here so it also replaces the returns above, which stop_event makes run() take
+            if self.error is not None:
+                raise self.error
+
+    def resume(self):
+        """
+        Carries on from the state saved in the store, if there is one
+
+        OUTPUT:
+        - None if the switch should start afresh, "counting" if the counter was set to the time that was left, or "alarm" if the
+          saved switch was sounding its alarm or ran out while nothing was running
+        """
+        saved = self.store.saved if self.store is not None else None
+        if saved is None or saved.state not in ("counting", "alarm"):
+            return None
+        self.lastReset = saved.last_reset
+        remaining = saved.remaining()
+        if saved.state == "counting" and remaining > 0:
+            self.counter.resume(remaining)
+            return "counting"
+        self.counter.resume(0)
+        return "alarm"
+
+    def save(self):
+        """
+        Saves the state, the deadline and the last reset to the store, if there is one
+        """
+        if self.store is not None:
+            self.store.save(self.state, time.time() + self.counter.remaining(), self.lastReset or 0.0)
+
+    def stop(self):
+        """
+        Asks run() to return as soon as possible, silencing the alarm if it is sounding
+        """
+        self.stop_event.set()
+        self.wake_event.set()
+
+    def fail(self, error):
+        """
+        Runs on the refresher or player thread when writing to the board fails, stopping the switch so run() raises the error
+        """
+        if self.error is None:
+            self.error = error
+        self.stop()
+
+    def heartbeat(self):
+        """
+        Runs on the heartbeat listener's worker thread for every reset it makes, resetting the counter like a press of the button
+        """
+        pressed = time.monotonic()
+        if self.state != "counting":
+            return
+        self.counter.reset()
+        self.handle_reset(pressed, chirp=False)
+
+    def handle_reset(self, pressed, chirp = True):
+        """
+        Runs on the button's worker thread once a press has reset the counter. Shows the new count straight away and chirps
+
+        INPUT:
+        - pressed representing the monotonic time the press was accepted
+        - chirp representing whether the buzzer confirms the reset, heartbeats come too often for it
+        """
+        #the reset only means something while counting down
+        if self.state != "counting":
+            return
+        self.seg.set_text(str(self.counter.count))
+        #the count loop picks the new count up too, and goes back to waiting for the next tick from it
+        self.wake_event.set()
+        self.seg.request_refresh()
+        if chirp:
+            self.buzzer.chirp()
+        self.lastReset = time.time()
+        self.save()
+        if self.seg.wait_for_scan(RESET_LATENCY_TARGET * 4):
+            self.lastResetLatency = time.monotonic() - pressed
+            self.resetLatency.observe(self.lastResetLatency)
+
+    def status(self):
+        """
+        OUTPUT:
+        - a dictionary describing the switch: its name, state, the count being shown, and how many frames have been shifted out
+        """
+        return {
+            "name": self.config.name,
+            "state": self.state,
+            "count": self.counter.count,
+            "frames_shifted": self.bitshift.framesShifted,
+            "frames_skipped": self.bitshift.framesSkipped,
+            "last_reset_latency": self.lastResetLatency,
+            "error": None if self.error is None else f"{type(self.error).__name__}: {self.error}",
+        }
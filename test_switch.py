@@ -0,0 +1,13 @@
+from benchmark import bench_reset_latency
+import random
+
+def test_reset_latency():
+    """
+    Presses the button of a switch running on a realtime simulated link at random points of the refresh cycle, and checks every press
+    is shown on the display within the reset latency target
+    """
+    #the same points of the refresh cycle are pressed on every run, so a failure can be reproduced
+    random.seed(0)
+    result = bench_reset_latency(3)
+    assert result["missed"] == 0, "a press was never shown on the display"
+    assert result["max_seconds"] < result["target_seconds"]
@@ -0,0 +1,190 @@
+from collections import defaultdict
+from firmata_commands import encode_pin_writes
+import argparse
+import functools
+import struct
+import threading
+import time
+
+#every record in a trace file is a header, (kind, tag, seconds since the trace started, value)
+RECORD = struct.Struct("<BHdH")
+
+#record kinds, a TAG record names a tag and is followed by value bytes of UTF-8, the others are messages sent to the board with value
+#being the pin written (PIN_WRITE) or the number of bytes sent (COMMAND and SYSEX)
+TAG = 0
+PIN_WRITE = 1
+COMMAND = 2
+SYSEX = 3
+
+#bytes of a single pin write on the link
+PIN_WRITE_BYTES = 3
+
+#tag given to messages sent outside of any traced operation
+UNTRACED = "untraced"
+
+#whether traced operations record their tags, checked on every call so it can be switched at runtime
+enabled = False
+
+#stack of the traced operations running on each thread
+local = threading.local()
+
+def enable():
+    global enabled
+    enabled = True
+
+def disable():
+    global enabled
+    enabled = False
+
+def current_tag():
+    """
+    OUTPUT:
+    - the traced operations running on this thread, outermost first and joined by "/", or UNTRACED if there are none
+    """
+    stack = getattr(local, "stack", None)
+    if not stack:
+        return UNTRACED
+    return "/".join(stack)
+
+def traced(function):
+    """
+    Decorator marking function as a high level operation, so every message sent to the board while it runs is attributed to it
+
+    When tracing is disabled the only cost is one check of a global flag before calling the function
+    """
+    name = function.__qualname__
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if not enabled:
+            return function(*args, **kwargs)
+        stack = getattr(local, "stack", None)
+        if stack is None:
+            stack = local.stack = []
+        stack.append(name)
+        try:
+            return function(*args, **kwargs)
+        finally:
+            stack.pop()
+    return wrapper
+
+class TracingBoard:
+    """
+    This class wraps an instantiated pymata4 board and has the same interface, writing every message sent through it to a trace file
+    along with the traced operation that sent it. Creating one enables tracing
+
+    Wrapping the pymata4 board underneath a CoalescingBoard traces what actually goes over the link, wrapping the proxy traces the
+    writes the components asked for
+
+    - path represents the file the trace is written to, it is buffered and only complete once close() has been called
+    """
+    def __init__(self, board, path) -> None:
+        self.board = board
+        self.file = open(path, "wb")
+        self.started = time.monotonic()
+        #the id given to every tag seen so far
+        self.tags = {}
+        self.lock = threading.Lock()
+        enable()
+
+    def __getattr__(self, name):
+        #pin modes, callbacks and frames go straight to the board
+        return getattr(self.board, name)
+
+    def record(self, kind, value):
+        tag = current_tag()
+        with self.lock:
+            if self.file is None:
+                return
+            number = self.tags.get(tag)
+            if number is None:
+                number = self.tags[tag] = len(self.tags)
+                name = tag.encode()
+                self.file.write(RECORD.pack(TAG, number, 0.0, len(name)) + name)
+            self.file.write(RECORD.pack(kind, number, time.monotonic() - self.started, value))
+
+    def digital_pin_write(self, pin, value):
+        self.record(PIN_WRITE, pin)
+        self.board.digital_pin_write(pin, value)
+
+    def digital_pin_write_many(self, writes):
+        writes = list(writes)
+        if hasattr(self.board, "digital_pin_write_many"):
+            self.record(COMMAND, PIN_WRITE_BYTES * len(writes))
+            self.board.digital_pin_write_many(writes)
+        else:
+            self._send_command(encode_pin_writes(writes))
+
+    def _send_command(self, command):
+        self.record(COMMAND, len(command))
+        return self.board._send_command(command)
+
+    def _send_sysex(self, sysex_command, sysex_data = None):
+        #start and end bytes, the command and its data
+        self.record(SYSEX, 3 + len(sysex_data or []))
+        return self.board._send_sysex(sysex_command, sysex_data)
+
+    def close(self):
+        """
+        Flushes and closes the trace file, and disables tracing
+        """
+        disable()
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+    def shutdown(self):
+        self.close()
+        self.board.shutdown()
+
+def read_trace(path):
+    """
+    OUTPUT:
+    - a list of (seconds, tag, kind, value) for every message in the trace file at path
+    """
+    with open(path, "rb") as file:
+        data = file.read()
+    names = {}
+    records = []
+    offset = 0
+    while offset + RECORD.size <= len(data):
+        kind, number, seconds, value = RECORD.unpack_from(data, offset)
+        offset += RECORD.size
+        if kind == TAG:
+            names[number] = data[offset:offset + value].decode()
+            offset += value
+        else:
+            records.append((seconds, names[number], kind, value))
+    return records
+
+def summarise(records, leaf = False):
+    """
+    INPUT:
+    - records representing the messages returned by read_trace()
+    - leaf representing whether messages are grouped by the innermost traced operation, rather than the whole stack of them
+
+    OUTPUT:
+    - a list of (tag, messages, bytes, share of all bytes), largest first
+    """
+    messages = defaultdict(int)
+    sizes = defaultdict(int)
+    for _, tag, kind, value in records:
+        if leaf:
+            tag = tag.rsplit("/", 1)[-1]
+        messages[tag] += 1
+        sizes[tag] += PIN_WRITE_BYTES if kind == PIN_WRITE else value
+    total = sum(sizes.values()) or 1
+    return sorted(((tag, messages[tag], sizes[tag], sizes[tag] / total) for tag in messages), key=lambda row: row[2], reverse=True)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="summarises a trace file by the operation that sent every message")
+    parser.add_argument("trace", help="trace file written by a TracingBoard")
+    parser.add_argument("--leaf", action="store_true", help="group by the innermost operation instead of the whole stack")
+    args = parser.parse_args()
+
+    records = read_trace(args.trace)
+    duration = records[-1][0] - records[0][0] if len(records) > 1 else 0.0
+    print(f"{len(records)} messages over {duration:.3f} seconds")
+    for tag, count, size, share in summarise(records, args.leaf):
+        print(f"{share:7.1%} {size:10d} bytes {count:8d} messages  {tag}")